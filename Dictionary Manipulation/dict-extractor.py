@@ -1,65 +1,296 @@
 # This script is designed to process text strings from a given file, identifying and separating known English words (of length 4 or more) from the remaining text. 
 # It uses a dictionary of English words, either from the NLTK corpus or a custom dictionary provided by the user. 
 # The script outputs two files: one containing the identified known words and another containing the remaining text.
+# All dictionary words of a line are found in one pass of an Aho-Corasick automaton, and the words covering most of the line
+# are kept, so known words are extracted even from strings that also contain unknown text (use --no-gaps to disable).
+# The compiled automaton is cached next to the dictionary index and memory-mapped by later runs.
 
 import argparse
-import nltk
+import array
+import bisect
+import itertools
+import mmap
+import multiprocessing
 import subprocess
+import os
+import struct
+import sys
 
-def find_longest_word(string, english_words, start, memo):
-    if start == len(string):
-        return []
+# The shared modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wordlist_store import open_dictionary
 
-    if start in memo:
-        return memo[start]
+# Only dictionary words of at least this many letters are extracted
+MIN_WORD_LENGTH = 4
 
-    longest_word = None
-    for end in range(start + 1, len(string) + 1):
-        word = string[start:end]
-        if word.lower() in english_words and len(word) >= 4 and (longest_word is None or len(word) > len(longest_word)):
-            longest_word = word
+# Lines sent to a worker process per task
+LINES_PER_TASK = 4096
 
-    if longest_word:
-        remainder = find_longest_word(string, english_words, start + len(longest_word), memo)
-        if remainder is not None:
-            memo[start] = [longest_word] + remainder
-            return memo[start]
+# Transitions of the automaton are keyed by (state << CHAR_BITS) | code point in a single dict while it is built
+CHAR_BITS = 21
 
-    memo[start] = None
-    return None
+# Compiled automaton file, next to the dictionary index, e.g. words.txt.lower-sorted.wlidx.min4.acauto
+# Layout: header | child starts, output starts (uint64, one per state + 1) | child codes, child states (uint32,
+# one per transition) | failure links (uint32, one per state) | output lengths (uint32)
+AUTOMATON_MAGIC = b"ACAUTO01"
 
-def find_words_in_string(string, english_words):
-    memo = {}
-    return find_longest_word(string, english_words, 0, memo)
+# magic, then the key it was built for: byte order (1 if big endian), minimum word length, size and mtime (ns)
+# of the index and of the wordlist it was built from; then the state, transition and output counts
+AUTOMATON_HEADER = struct.Struct("<8sQQQQQQQQQ")
+
+# Set in every worker process by init_worker
+_worker_automaton = None
+_worker_allow_gaps = True
+
+def build_automaton(english_words, min_length=MIN_WORD_LENGTH, key=None):
+    """
+    Aho-Corasick automaton over the lowercase dictionary words of at least min_length letters, so every
+    dictionary word in a line is found in a single pass over it.
+    Returns the compiled automaton file contents (see AUTOMATON_MAGIC), to be opened with Automaton; key is
+    the header key of a cache file (see automaton_key).
+    """
+    transitions = {}
+    parents, codes, depths, outputs = [0], [0], [0], [()]
+    for word in english_words:
+        # Lines are matched in lowercase, so only lowercase entries can match (like word.lower() in english_words)
+        if len(word) < min_length or word != word.lower():
+            continue
+        state = 0
+        for char in word:
+            key_code = state << CHAR_BITS | ord(char)
+            next_state = transitions.get(key_code)
+            if next_state is None:
+                next_state = len(parents)
+                transitions[key_code] = next_state
+                parents.append(state)
+                codes.append(ord(char))
+                depths.append(depths[state] + 1)
+                outputs.append(())
+            state = next_state
+        outputs[state] = (len(word),)
+
+    # Failure links in breadth-first order: the longest proper suffix of a state that is also in the trie
+    fail = array.array("I", bytes(4 * len(parents)))
+    for state in sorted(range(1, len(parents)), key=depths.__getitem__):
+        parent, code = parents[state], codes[state]
+        if parent:
+            suffix = fail[parent]
+            while True:
+                next_state = transitions.get(suffix << CHAR_BITS | code)
+                if next_state is not None or not suffix:
+                    break
+                suffix = fail[suffix]
+            fail[state] = next_state or 0
+        if outputs[fail[state]]:
+            outputs[state] += outputs[fail[state]]
+
+    # The children of every state, sorted by code point, so a transition is a binary search in them
+    child_starts, child_codes, child_states = array.array("Q", [0]), array.array("I"), array.array("I")
+    for key_code in sorted(transitions):
+        state = key_code >> CHAR_BITS
+        while len(child_starts) <= state:
+            child_starts.append(len(child_codes))
+        child_codes.append(key_code & ((1 << CHAR_BITS) - 1))
+        child_states.append(transitions[key_code])
+    while len(child_starts) <= len(parents):
+        child_starts.append(len(child_codes))
+    output_starts, output_lengths = array.array("Q", [0]), array.array("I")
+    for lengths in outputs:
+        output_lengths.extend(lengths)
+        output_starts.append(len(output_lengths))
+
+    header = AUTOMATON_HEADER.pack(AUTOMATON_MAGIC, *(key or automaton_key(None, min_length)),
+                                   len(parents), len(child_codes), len(output_lengths))
+    return b"".join([header, child_starts.tobytes(), output_starts.tobytes(), child_codes.tobytes(),
+                     child_states.tobytes(), fail.tobytes(), output_lengths.tobytes()])
+
+class Automaton:
+    """
+    Read-only view of a compiled automaton, memory-mapped from its cache file or held in memory.
+    """
+    def __init__(self, data, automaton_file=None):
+        self.automaton_file = automaton_file
+        self._data = data
+        header = AUTOMATON_HEADER.unpack_from(data)
+        if header[0] != AUTOMATON_MAGIC:
+            raise ValueError(f"{automaton_file} is not a compiled automaton")
+        self.key = header[1:-3]
+        states, transitions, outputs = header[-3:]
+        sizes = [("child_starts", "Q", states + 1), ("output_starts", "Q", states + 1), ("child_codes", "I", transitions),
+                 ("child_states", "I", transitions), ("fail", "I", states), ("output_lengths", "I", outputs)]
+        view, offset = memoryview(data), AUTOMATON_HEADER.size
+        if offset + sum(struct.calcsize(code) * count for _, code, count in sizes) != len(data):
+            raise ValueError(f"{automaton_file} is truncated")
+        for name, code, count in sizes:
+            end = offset + struct.calcsize(code) * count
+            setattr(self, name, view[offset:end].cast(code))
+            offset = end
+
+    @classmethod
+    def open(cls, automaton_file):
+        with open(automaton_file, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), automaton_file)
+
+    def __reduce__(self):
+        # Worker processes started by spawn map the cache file again instead of receiving the arrays
+        if self.automaton_file:
+            return Automaton.open, (self.automaton_file,)
+        return Automaton, (bytes(self._data),)
+
+def automaton_key(english_words, min_length):
+    """
+    The header key of the cached automaton of a dictionary store: it is rebuilt whenever the index or the
+    wordlist it was built from changes (size or mtime), or for another minimum word length.
+    """
+    if english_words is None:
+        return (int(sys.byteorder == "big"), min_length, 0, 0, 0, 0)
+    stat = os.stat(english_words.index_file)
+    return (int(sys.byteorder == "big"), min_length, stat.st_size, stat.st_mtime_ns,
+            english_words.source_size, english_words.source_mtime)
+
+def load_automaton(english_words, min_length=MIN_WORD_LENGTH):
+    """
+    Opens the cached automaton of a dictionary store if it is current, else builds it and caches it next to
+    the index. If the index is temporary or its directory read-only, the automaton is only kept in memory.
+    """
+    try:
+        key = automaton_key(english_words, min_length)
+    except OSError:
+        return Automaton(build_automaton(english_words, min_length))
+    automaton_file = f"{english_words.index_file}.min{min_length}.acauto"
+    try:
+        automaton = Automaton.open(automaton_file)
+        if automaton.key == key:
+            return automaton
+    except (OSError, ValueError, struct.error):
+        pass
+    data = build_automaton(english_words, min_length, key)
+    try:
+        with open(automaton_file + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(automaton_file + ".tmp", automaton_file)
+        return Automaton.open(automaton_file)
+    except OSError:
+        return Automaton(data)
+
+def lowercase_same_length(string):
+    """
+    Lowercase a string without changing character positions (a few characters lowercase to two).
+    """
+    lowered = string.lower()
+    if len(lowered) == len(string):
+        return lowered
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in string)
+
+def segment_string(string, automaton, allow_gaps=True):
+    """
+    Split a string into known dictionary words and the remaining text.
+
+    All dictionary words in the string are found in one pass of the automaton; a dynamic program over the
+    string then picks the non-overlapping words covering the most characters (and among those, the fewest,
+    longest words). The characters between them are the unknown gaps. Without allow_gaps, only a covering
+    of the whole string is accepted.
+    Returns (words, remaining text); words is empty if no (acceptable) segmentation was found.
+    """
+    child_starts, child_codes, child_states = automaton.child_starts, automaton.child_codes, automaton.child_states
+    fail, output_starts, output_lengths = automaton.fail, automaton.output_starts, automaton.output_lengths
+    # covered[i] and count[i]: characters covered and words used by the best segmentation of string[:i],
+    # word_length[i]: length of its last word, 0 if string[i - 1] is part of a gap
+    covered = [0] * (len(string) + 1)
+    count = [0] * (len(string) + 1)
+    word_length = [0] * (len(string) + 1)
+    state = 0
+    for end, char in enumerate(lowercase_same_length(string), 1):
+        code = ord(char)
+        while True:
+            low, high = child_starts[state], child_starts[state + 1]
+            child = bisect.bisect_left(child_codes, code, low, high)
+            if child < high and child_codes[child] == code:
+                state = child_states[child]
+                break
+            if not state:
+                break
+            state = fail[state]
+
+        best_covered, best_count, best_length = covered[end - 1], count[end - 1], 0
+        for length in output_lengths[output_starts[state]:output_starts[state + 1]]:
+            start = end - length
+            if covered[start] + length > best_covered or (covered[start] + length == best_covered and count[start] + 1 < best_count):
+                best_covered, best_count, best_length = covered[start] + length, count[start] + 1, length
+        covered[end], count[end], word_length[end] = best_covered, best_count, best_length
+
+    if not covered[-1] or (not allow_gaps and covered[-1] != len(string)):
+        return [], string
+
+    words, gaps = [], []
+    end = len(string)
+    while end:
+        if word_length[end]:
+            words.append(string[end - word_length[end]:end])
+            end -= word_length[end]
+        else:
+            gaps.append(string[end - 1])
+            end -= 1
+    return words[::-1], "".join(reversed(gaps))
+
+def init_worker(automaton, allow_gaps):
+    """
+    Store the automaton once per worker process instead of sending it with every task.
+    """
+    global _worker_automaton, _worker_allow_gaps
+    _worker_automaton = automaton
+    _worker_allow_gaps = allow_gaps
+
+def segment_lines(lines):
+    """
+    Worker task: (line, words, remaining text) for every line of a batch.
+    """
+    results = []
+    for line in lines:
+        words, remaining = segment_string(line.strip(), _worker_automaton, _worker_allow_gaps)
+        results.append((line, words, remaining))
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description='Split strings into known and unknown parts.')
     parser.add_argument('input_file', type=str, help='Path to the input file containing text strings')
     parser.add_argument('--custom_dict', type=str, help='Path to a custom dictionary file')
+    parser.add_argument('--min-length', type=int, default=MIN_WORD_LENGTH, help=f'Minimum length of the extracted words. Default: {MIN_WORD_LENGTH}')
+    parser.add_argument('--no-gaps', action='store_true', help='Only split strings that consist entirely of known words, leaving no unknown text')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(), help='Number of worker processes. Default: number of CPUs')
     args = parser.parse_args()
 
-    if args.custom_dict:
-        with open(args.custom_dict, 'r') as file:
-            english_words = set(word.strip().lower() for word in file)
-    else:
-        nltk.download('words')
-        from nltk.corpus import words
-        english_words = set(words.words())
+    # Without --custom_dict the NLTK words corpus is compiled once (python3 wordlist_store.py --nltk); the
+    # automaton over its words is compiled on the first run and memory-mapped from its cache file afterwards
+    english_words = open_dictionary(args.custom_dict)
+
+    automaton = load_automaton(english_words, args.min_length)
+    allow_gaps = not args.no_gaps
 
     with open(args.input_file, 'r') as file, \
          open('known_words.txt', 'w') as known_file, \
          open('remaining_text.txt', 'w') as remaining_file:
-        for line in file:
-            words = find_words_in_string(line.strip(), english_words)
-            if words:
-                known_file.write('\n'.join(words) + '\n')
-                remaining = line.strip()
-                for word in words:
-                    remaining = remaining.replace(word, '', 1)
-                if remaining:
-                    remaining_file.write(remaining + '\n')
-            else:
-                remaining_file.write(line)
+        batches = iter(lambda: list(itertools.islice(file, LINES_PER_TASK)), [])
+        if args.workers > 1:
+            pool = multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(automaton, allow_gaps))
+            results = pool.imap(segment_lines, batches)
+        else:
+            pool = None
+            init_worker(automaton, allow_gaps)
+            results = map(segment_lines, batches)
+        try:
+            for batch in results:
+                for line, words, remaining in batch:
+                    if words:
+                        known_file.write('\n'.join(words) + '\n')
+                        if remaining:
+                            remaining_file.write(remaining + '\n')
+                    else:
+                        remaining_file.write(line)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
     # Sorting and removing duplicates from the output files
     subprocess.run(['sort', '-u', 'known_words.txt', '-o', 'known_words.txt'])
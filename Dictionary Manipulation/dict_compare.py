@@ -1,40 +1,233 @@
 # This script is designed to check if words in a given text file are English words. 
 # It compares each word in the file against a list of English words, which can be either from the NLTK corpus or a custom dictionary provided by the user. 
 # The script outputs a list of non-English words found in the text file.
+# For reference lists too large for memory (e.g. multi-GB cracked password corpora) there are two streaming modes:
+#   --mode bloom: lookups in a prebuilt Bloom filter file (a few bits per word, configurable false positive rate)
+#   --mode merge: both files are sorted externally in chunks of --memory-limit and merge-joined (exact)
 
 import argparse
-import nltk
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+
+# The shared modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wordlist_store import DEFAULT_MEMORY_LIMIT, NLTK_INDEX_FILE, external_sort, open_dictionary, parse_memory_size
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+
+# Bloom filter file: header | bit array. The header records the reference list and the options it was built with.
+# magic, bit count, hash count, word count, size and mtime (ns) of the reference list,
+# requested false positive rate, memory limit
+BLOOM_MAGIC = b"WLBLOOM2"
+BLOOM_HEADER = struct.Struct("<8sQQQQQdQ")
 
 # Function to check if a word is an English word
 def is_english_word(word, english_words):
     return word.lower() in english_words
 
+def lookup_key(word):
+    """
+    Lowercases a stripped word (bytes) the way dictionary lookups do.
+    """
+    if word.isascii():
+        return word.lower()
+    return word.decode("utf-8", errors="replace").lower().encode("utf-8")
+
+def reference_keys(custom_dict):
+    """
+    Yields the lookup key of every word of the reference list: custom_dict, or the compiled NLTK words.
+    """
+    if custom_dict:
+        with open(custom_dict, "rb") as file:
+            for line in file:
+                yield lookup_key(line.strip())
+    else:
+        with open_dictionary() as store:
+            for index in range(len(store)):
+                yield store.word_bytes(index)
+
+def compare_sorted(input_file, custom_dict, memory_limit, difference_file, intersection_file=None):
+    """
+    Exact out-of-core comparison. The input words (keyed by their lookup key) and the reference list are sorted
+    externally, then merge-joined; words are written sorted and deduplicated as the merge goes.
+    Returns the number of words written to difference_file.
+    """
+    def input_records():
+        with open(input_file, "rb") as file:
+            for line in file:
+                word = line.strip()
+                yield lookup_key(word) + b"\0" + word
+
+    # The memory limit is shared by the two sorts
+    words = external_sort(input_records(), memory_limit // 2)
+    if custom_dict:
+        reference = external_sort(reference_keys(custom_dict), memory_limit // 2)
+    else:
+        reference = reference_keys(None)  # The compiled NLTK words are already sorted and unique
+
+    written = 0
+    with open(difference_file, "wb") as difference, \
+         (open(intersection_file, "wb") if intersection_file else open(os.devnull, "wb")) as intersection:
+        reference_key = next(reference, None)
+        for record in words:
+            key, word = record.split(b"\0", 1)
+            while reference_key is not None and reference_key < key:
+                reference_key = next(reference, None)
+            if key == reference_key:
+                intersection.write(word + b"\n")
+            else:
+                difference.write(word + b"\n")
+                written += 1
+    return written
+
+def bloom_parameters(count, false_positive_rate):
+    """
+    Bit and hash counts of a Bloom filter holding count words with the given false positive rate.
+    """
+    bits = max(64, math.ceil(-max(count, 1) * math.log(false_positive_rate) / math.log(2) ** 2))
+    return bits, max(1, round(bits / max(count, 1) * math.log(2)))
+
+def bloom_positions(key, bits, hashes):
+    """
+    The bit positions of a key: double hashing of a 128 bit BLAKE2b digest.
+    """
+    first, second = struct.unpack("<QQ", hashlib.blake2b(key, digest_size=16).digest())
+    return [(first + i * second) % bits for i in range(hashes)]
+
+class BloomFilter:
+    """
+    Read-only, memory-mapped Bloom filter built by build_bloom_filter.
+    """
+    def __init__(self, filter_file):
+        with open(filter_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.bits, self.hashes, self.count, self.source_size, self.source_mtime,
+             self.requested_false_positive_rate, self.memory_limit) = BLOOM_HEADER.unpack_from(self._mmap)
+            if magic != BLOOM_MAGIC or len(self._mmap) < BLOOM_HEADER.size + (self.bits + 7) // 8:
+                raise ValueError(f"{filter_file} is not a Bloom filter")
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise
+
+    def false_positive_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def __contains__(self, key):
+        data = self._mmap
+        for position in bloom_positions(key, self.bits, self.hashes):
+            if not data[BLOOM_HEADER.size + (position >> 3)] >> (position & 7) & 1:
+                return False
+        return True
+
+    def close(self):
+        self._mmap.close()
+
+def build_bloom_filter(custom_dict, filter_file, false_positive_rate, memory_limit):
+    """
+    Builds the Bloom filter of the reference list in two streaming passes (count, then set bits). The bit array
+    is capped at memory_limit, which raises the false positive rate.
+    """
+    source = custom_dict or NLTK_INDEX_FILE
+    count = sum(1 for _ in reference_keys(custom_dict))
+    stat = os.stat(source)
+    bits, hashes = bloom_parameters(count, false_positive_rate)
+    if bits > memory_limit * 8:
+        print(f"The Bloom filter for a false positive rate of {false_positive_rate:g} needs {(bits + 7) // 8} bytes, capped at --memory-limit")
+        bits = memory_limit * 8
+        hashes = max(1, round(bits / max(count, 1) * math.log(2)))
+    bit_array = bytearray((bits + 7) // 8)
+    for key in reference_keys(custom_dict):
+        for position in bloom_positions(key, bits, hashes):
+            bit_array[position >> 3] |= 1 << (position & 7)
+    tmp_file = filter_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, bits, hashes, count, stat.st_size, stat.st_mtime_ns,
+                                  false_positive_rate, memory_limit))
+        f.write(bit_array)
+    os.replace(tmp_file, filter_file)
+
+def open_bloom_filter(custom_dict, filter_file, false_positive_rate, memory_limit):
+    """
+    Opens the Bloom filter of the reference list, building (or rebuilding, if the list, the false positive rate
+    or the memory limit changed) it first.
+    """
+    stat = os.stat(custom_dict or NLTK_INDEX_FILE)
+    try:
+        bloom = BloomFilter(filter_file)
+    except (OSError, ValueError, struct.error):
+        bloom = None
+    if bloom is not None:
+        if (bloom.source_size == stat.st_size and bloom.source_mtime == stat.st_mtime_ns
+                and bloom.requested_false_positive_rate == false_positive_rate and bloom.memory_limit == memory_limit):
+            return bloom
+        bloom.close()
+    build_bloom_filter(custom_dict, filter_file, false_positive_rate, memory_limit)
+    return BloomFilter(filter_file)
+
+def compare_streaming(input_file, is_known, difference_file, intersection_file=None):
+    """
+    Streams the input words through is_known (a lookup in the dictionary index or the Bloom filter), writing
+    each word to the difference (or intersection) file as it is read, in input order.
+    Returns the number of words written to difference_file.
+    """
+    written = 0
+    with open(input_file, "rb") as file, open(difference_file, "wb") as difference, \
+         (open(intersection_file, "wb") if intersection_file else open(os.devnull, "wb")) as intersection:
+        for line in file:
+            word = line.strip()
+            if is_known(word):
+                intersection.write(word + b"\n")
+            else:
+                difference.write(word + b"\n")
+                written += 1
+    return written
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Compare words in a file against an English dictionary.')
     parser.add_argument('input_file', type=str, help='Path to the input file containing text strings')
     parser.add_argument('--custom_dict', type=str, help='Path to a custom dictionary file')
+    parser.add_argument('--mode', choices=['index', 'bloom', 'merge'], default='index',
+                        help="index: binary search in the memory-mapped dictionary (default). "
+                             "bloom: lookups in a Bloom filter of the dictionary, for huge reference lists (may miss a few non-English words). "
+                             "merge: exact external sort and merge of both files in bounded memory (output is sorted and unique)")
+    parser.add_argument('--memory-limit', type=parse_memory_size, default=parse_memory_size(DEFAULT_MEMORY_LIMIT),
+                        help=f'Memory for the sort runs (merge) or the bit array (bloom). Default: {DEFAULT_MEMORY_LIMIT}')
+    parser.add_argument('--filter', type=str, help='Bloom filter file, built on first use. Default: <custom_dict>.bloom')
+    parser.add_argument('--false-positive-rate', type=float, default=DEFAULT_FALSE_POSITIVE_RATE,
+                        help=f'False positive rate of a new Bloom filter. Default: {DEFAULT_FALSE_POSITIVE_RATE}')
+    parser.add_argument('--intersection', nargs='?', const='english_words.txt',
+                        help="Also write the words found in the dictionary (default file: english_words.txt)")
     args = parser.parse_args()
 
-    # Load English words
-    if args.custom_dict:
-        with open(args.custom_dict, 'r') as file:
-            english_words = set(word.strip().lower() for word in file)
+    if args.mode == 'merge':
+        compare_sorted(args.input_file, args.custom_dict, args.memory_limit, 'non_english_words.txt', args.intersection)
+    elif args.mode == 'bloom':
+        filter_file = args.filter or (args.custom_dict or NLTK_INDEX_FILE) + '.bloom'
+        if not args.custom_dict:
+            open_dictionary().close()  # Compile the NLTK words first if needed
+        bloom = open_bloom_filter(args.custom_dict, filter_file, args.false_positive_rate, args.memory_limit)
+        print(f"Bloom filter {filter_file}: {bloom.count} words, false positive rate {bloom.false_positive_rate():.2g}")
+        compare_streaming(args.input_file, lambda word: lookup_key(word) in bloom, 'non_english_words.txt', args.intersection)
+        bloom.close()
     else:
-        nltk.download('words')
-        from nltk.corpus import words
-        english_words = set(words.words())
-
-    # Read the input file and compare each word
-    with open(args.input_file, 'r') as file:
-        non_english_words = [word.strip() for word in file if not is_english_word(word.strip(), english_words)]
-
-    # Write non-English words to a new file
-    with open('non_english_words.txt', 'w') as new_file:
-        for word in non_english_words:
-            new_file.write(word + '\n')
+        # Load English words
+        # Sorted, lowercased and memory-mapped: lookups are binary searches instead of a set of every word.
+        # Without --custom_dict the NLTK words corpus is compiled once (python3 wordlist_store.py --nltk)
+        english_words = open_dictionary(args.custom_dict)
+        # Read the input file and compare each word, writing non-English words to a new file as they are found
+        compare_streaming(args.input_file, lambda word: is_english_word(word.decode('utf-8', errors='replace'), english_words),
+                          'non_english_words.txt', args.intersection)
+        english_words.close()
 
     print("Non-English words have been saved to non_english_words.txt")
+    if args.intersection:
+        print(f"English words have been saved to {args.intersection}")
 
 if __name__ == "__main__":
     main()
@@ -1,41 +1,33 @@
-# This script extracts and categorizes strings from a given text file into two categories: letters and non-letters. 
-# Each category is saved in a separate output file.
-# This is a less robust version of extract_strings.py and the 
-
-
-import argparse
-import re
-import subprocess
-
-def extract_strings(input_file, output_file_letters, output_file_others):
-    with open(input_file, 'r') as file:
-        lines = file.readlines()
-
-    with open(output_file_letters, 'w') as file_letters, open(output_file_others, 'w') as file_others:
-        for line in lines:
-            # Split the line into sequences of letters and non-letters
-            sequences = re.findall(r'([a-zA-Z]+|[^a-zA-Z]+)', line)
-
-            for seq in sequences:
-                if re.match(r'[a-zA-Z]+', seq):
-                    # Write to letters file
-                    file_letters.write(seq + '\n')
-                else:
-                    # Write to others file
-                    file_others.write(seq + '\n')
-
-    # Sorting and removing duplicates in each file
-    subprocess.run(['sort', '-u', output_file_letters, '-o', output_file_letters])
-    subprocess.run(['sort', '-u', output_file_others, '-o', output_file_others])
-
-def main():
-    parser = argparse.ArgumentParser(description='Extract and categorize strings into letters and non-letters.')
-    parser.add_argument('input_file', type=str, help='Path to the input file')
-    parser.add_argument('output_file_letters', type=str, help='Path to the output file for letters')
-    parser.add_argument('output_file_others', type=str, help='Path to the output file for non-letters')
-    args = parser.parse_args()
-
-    extract_strings(args.input_file, args.output_file_letters, args.output_file_others)
-
-if __name__ == "__main__":
-    main()
+# This script extracts and categorizes strings from a given text file into two categories: letters and non-letters. 
+# Each category is saved in a separate output file, deduplicated and sorted by frequency (counted like extract_strings.py).
+# This is a less robust version of extract_strings.py and the 
+
+
+import argparse
+import re
+
+from extract_strings import add_count_arguments, count_tokens, write_counts
+from wordlist_store import DEFAULT_MEMORY_LIMIT, parse_memory_size
+
+# Split a line into sequences of letters and non-letters
+TOKENIZER = re.compile(r'(?P<letters>[a-zA-Z]+)|(?P<others>[^a-zA-Z]+)')
+
+def extract_strings(input_file, output_file_letters, output_file_others, min_count=1, top=None, with_counts=False, memory_limit=parse_memory_size(DEFAULT_MEMORY_LIMIT)):
+    output_files = {'letters': output_file_letters, 'others': output_file_others}
+    counters = count_tokens(input_file, TOKENIZER, output_files, memory_limit)
+    for category, output_file in output_files.items():
+        write_counts(counters[category], output_file, min_count, top, with_counts, memory_limit)
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract and categorize strings into letters and non-letters.')
+    parser.add_argument('input_file', type=str, help='Path to the input file')
+    parser.add_argument('output_file_letters', type=str, help='Path to the output file for letters')
+    parser.add_argument('output_file_others', type=str, help='Path to the output file for non-letters')
+    add_count_arguments(parser)
+    args = parser.parse_args()
+
+    extract_strings(args.input_file, args.output_file_letters, args.output_file_others,
+                    args.min_count, args.top, args.with_counts, args.memory_limit)
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,168 @@
 # This script is designed to extract and categorize different types of string sequences from a given text file. 
 # It categorizes strings into four categories: letters, short letters, numbers, and special characters. 
-# Each category is saved in a separate output file, and the contents of these files are sorted and deduplicated.
+# Each category is saved in a separate output file, deduplicated and sorted by how often each string appeared (most frequent first).
+# Every line is tokenized by a single compiled regular expression and the strings are counted in memory; when the counters
+# outgrow --memory-limit they are spilled to disk as sorted runs, which are merged at the end.
 
+import argparse
+import heapq
+import itertools
+import os
 import re
-import subprocess
-
-def extract_strings(input_file, output_files):
-    with open(input_file, 'r') as file:
-        lines = file.readlines()
-
-    file_handles = {key: open(file, 'w') for key, file in output_files.items()}
-
-    for line in lines:
-        # Split the line into sequences of letters, digits, and others
-        sequences = re.findall(r'([a-zA-Z]+|\d+|[^a-zA-Z\d]+)', line)
-
-        for seq in sequences:
-            if re.match(r'[a-zA-Z]{3,}', seq):
-                file_handles['letters'].write(seq + '\n')
-            elif re.match(r'[a-zA-Z]{1,2}', seq):
-                file_handles['short_letters'].write(seq + '\n')
-            elif re.match(r'\d+', seq):
-                file_handles['numbers'].write(seq + '\n')
-            elif re.match(r'[^a-zA-Z\d]+', seq):
-                file_handles['specials'].write(seq + '\n')
-
-    # Close all file handles
-    for file in file_handles.values():
-        file.close()
-
-    # Sort and remove duplicates in each file
-    for file in output_files.values():
-        subprocess.run(['sort', '-u', file, '-o', file])
-
-# Example usage
-input_file = 'input.txt'  # Replace with your input file path
-output_files = {
+import sys
+import tempfile
+from collections import Counter
+
+# The shared modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wordlist_store import DEFAULT_MEMORY_LIMIT, parse_memory_size
+
+# Split a line into sequences of letters, digits, and others; the name of the matching group is the category
+TOKENIZER = re.compile(r'(?P<letters>[a-zA-Z]{3,})|(?P<short_letters>[a-zA-Z]{1,2})|(?P<numbers>\d+)|(?P<specials>[^a-zA-Z\d]+)')
+
+OUTPUT_FILES = {
     'letters': 'letters.txt',
     'specials': 'specials.txt',
     'short_letters': 'short_letters.txt',
     'numbers': 'numbers.txt'
 }
-extract_strings(input_file, output_files)
+
+# Approximate memory of one counter entry (dict slot, str and int objects), on top of the string length
+ENTRY_OVERHEAD = 120
+
+class TokenCounter:
+    """
+    Counts the strings of one category. Counts that were spilled to disk (spill) are merged back by totals.
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self.runs = []
+
+    def spill(self):
+        """
+        Write the counts to a temporary run sorted by string (count<TAB>string per line) and clear them.
+        """
+        run = tempfile.TemporaryFile('w+', encoding='utf-8', errors='surrogateescape', newline='\n')
+        for token in sorted(self.counts):
+            run.write(f"{self.counts[token]}\t{token}\n")
+        run.seek(0)
+        self.runs.append(run)
+        self.counts = Counter()
+
+    def totals(self):
+        """
+        Yields (string, count) pairs, the counts of the runs and of memory summed, sorted by string.
+        """
+        if not self.runs:
+            yield from sorted(self.counts.items())
+            return
+        def read_run(run):
+            for line in run:
+                count, token = line[:-1].split('\t', 1)
+                yield token, int(count)
+        merged = heapq.merge(*(read_run(run) for run in self.runs), sorted(self.counts.items()))
+        for token, group in itertools.groupby(merged, key=lambda item: item[0]):
+            yield token, sum(count for _, count in group)
+
+    def most_common(self, min_count=1, top=None, memory_limit=None):
+        """
+        Yields (string, count) pairs with at least min_count occurrences, most frequent first (ties by string),
+        at most top of them. Counts that did not fit in memory are sorted by frequency externally too.
+        """
+        key = lambda item: (-item[1], item[0])
+        totals = (item for item in self.totals() if item[1] >= min_count)
+        if top is not None:
+            yield from heapq.nsmallest(top, totals, key=key)
+        elif not self.runs:
+            yield from sorted(totals, key=key)
+        else:
+            yield from heapq.merge(*sorted_runs(totals, key, memory_limit), key=key)
+
+def sorted_runs(items, key, memory_limit):
+    """
+    Split (string, count) pairs into runs that fit in memory_limit, each sorted by key; runs after the first are
+    kept in temporary files. Returns an iterator per run.
+    """
+    runs, run, run_size = [], [], 0
+    for item in items:
+        run.append(item)
+        run_size += len(item[0]) + ENTRY_OVERHEAD
+        if run_size >= memory_limit:
+            run.sort(key=key)
+            spilled = tempfile.TemporaryFile('w+', encoding='utf-8', errors='surrogateescape', newline='\n')
+            spilled.writelines(f"{count}\t{token}\n" for token, count in run)
+            spilled.seek(0)
+            runs.append((token, int(count)) for count, token in (line[:-1].split('\t', 1) for line in spilled))
+            run, run_size = [], 0
+    run.sort(key=key)
+    runs.append(iter(run))
+    return runs
+
+def count_tokens(input_file, tokenizer, categories, memory_limit):
+    """
+    Count the strings of every category in one pass over the input file. Returns a TokenCounter per category.
+    """
+    counters = {category: TokenCounter() for category in categories}
+    counts = {category: counter.counts for category, counter in counters.items()}
+    size = 0
+    with open(input_file, 'r', encoding='utf-8', errors='surrogateescape') as file:
+        for line in file:
+            for match in tokenizer.finditer(line.rstrip('\r\n')):
+                category_counts = counts[match.lastgroup]
+                token = match.group()
+                count = category_counts.get(token)
+                if count is not None:
+                    category_counts[token] = count + 1
+                    continue
+                category_counts[token] = 1
+                size += len(token) + ENTRY_OVERHEAD
+                if size >= memory_limit:
+                    for counter in counters.values():
+                        counter.spill()
+                    counts = {category: counter.counts for category, counter in counters.items()}
+                    size = 0
+    return counters
+
+def write_counts(counter, output_file, min_count=1, top=None, with_counts=False, memory_limit=None):
+    """
+    Write the distinct strings of a category to output_file, most frequent first. Returns how many were written.
+    """
+    written = 0
+    with open(output_file, 'w', encoding='utf-8', errors='surrogateescape') as file:
+        for token, count in counter.most_common(min_count, top, memory_limit):
+            file.write(f"{count}\t{token}\n" if with_counts else token + '\n')
+            written += 1
+    return written
+
+def add_count_arguments(parser):
+    """
+    Adds the counting and cut-off options shared with extract_strings-v0.py.
+    """
+    parser.add_argument('--min-count', type=int, default=1, help='Only keep strings that appeared at least this many times')
+    parser.add_argument('--top', type=int, help='Only keep the N most frequent strings of each category')
+    parser.add_argument('--with-counts', action='store_true', help='Write "count<TAB>string" lines instead of just the strings')
+    parser.add_argument('--memory-limit', type=parse_memory_size, default=parse_memory_size(DEFAULT_MEMORY_LIMIT),
+                        help=f'Memory for the counters before they are spilled to disk. Default: {DEFAULT_MEMORY_LIMIT}')
+
+def extract_strings(input_file, output_files, min_count=1, top=None, with_counts=False, memory_limit=parse_memory_size(DEFAULT_MEMORY_LIMIT)):
+    counters = count_tokens(input_file, TOKENIZER, output_files, memory_limit)
+    for category, output_file in output_files.items():
+        written = write_counts(counters[category], output_file, min_count, top, with_counts, memory_limit)
+        print(f"{output_file}: {written} strings")
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract letters, short letters, numbers and special characters from a file, counted and sorted by frequency.')
+    parser.add_argument('input_file', type=str, help='Path to the input file')
+    parser.add_argument('--output-dir', type=str, default='.', help='Directory of the output files (letters.txt, specials.txt, short_letters.txt, numbers.txt). Default: current directory')
+    add_count_arguments(parser)
+    args = parser.parse_args()
+    try:
+        os.makedirs(args.output_dir, exist_ok=True)
+    except OSError as e:
+        parser.error(f"cannot create --output-dir {args.output_dir}: {e.strerror}")
+
+    output_files = {category: os.path.join(args.output_dir, file) for category, file in OUTPUT_FILES.items()}
+    extract_strings(args.input_file, output_files, args.min_count, args.top, args.with_counts, args.memory_limit)
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,17 @@
 
 
 import argparse
+import os
+import sys
 
-def convert_to_hashcat_rules(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
+# The shared modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wordlist_store import open_wordlist
 
-    prefix_rules = []
-    suffix_rules = []
-
-    for line in lines:
-        line = line.strip()
-        prefix_rule = ''.join([f'^{char}' for char in line])
-        suffix_rule = ''.join([f'${char}' for char in line])
-
-        prefix_rules.append(prefix_rule)
-        suffix_rules.append(suffix_rule)
+def convert_to_hashcat_rules(lines):
+    # The rules are generated lazily from the memory-mapped wordlist instead of holding every line twice
+    prefix_rules = (''.join([f'^{char}' for char in line.strip()]) for line in lines)
+    suffix_rules = (''.join([f'${char}' for char in line.strip()]) for line in lines)
 
     return prefix_rules, suffix_rules
 
@@ -38,8 +34,9 @@ def main():
     parser.add_argument('output_file', type=str, help='Path to the output file')
     args = parser.parse_args()
 
-    prefix_rules, suffix_rules = convert_to_hashcat_rules(args.input_file)
-    write_rules_to_file(prefix_rules, suffix_rules, args.output_file)
+    with open_wordlist(args.input_file) as lines:
+        prefix_rules, suffix_rules = convert_to_hashcat_rules(lines)
+        write_rules_to_file(prefix_rules, suffix_rules, args.output_file)
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,370 @@
 import argparse
+import array
+import bisect
 import itertools
+import math
+import multiprocessing
+import os
+import struct
+
+from keyspace_planner import add_plan_arguments, format_file_size, print_plan
+from wordlist_store import FLAG_TABBED, SORT_MEMORY_LIMIT, external_sort, open_wordlist
+
+# How many combinations a worker generates per task
+CHUNK_SIZE = 1 << 20
+
+# The last slot is read once for every combination of the other slots, so it is kept in memory up to this size
+LAST_SLOT_CACHE = 64 * 1024 ** 2
+
+# Bisection steps spent looking for the --top score threshold, and how close it gets: at most top / TOP_THRESHOLD_SLACK
+# extra combinations reach it
+TOP_THRESHOLD_STEPS = 64
+TOP_THRESHOLD_SLACK = 8
+
+# Approximate memory per cached entry (bytes object and list slot), on top of its length
+ENTRY_OVERHEAD = 41
+
+# Per worker state, set once by init_worker
+_worker_slots = None
+_worker_prepend = None
+
+def parse_dict_line(line):
+    """Split a stripped dictionary line into (word, number). The number comes from an optional
+    word<TAB>number column and is None if the line has no positive number after its last tab."""
+    word, tab, number = line.rpartition("\t")
+    if tab and word:
+        try:
+            value = float(number)
+        except ValueError:
+            return line, None
+        if 0 < value < math.inf:
+            return word, value
+    return line, None
+
+class DictWords:
+    """Lazy view of the (word, number) entries of a dictionary file, skipping empty lines. The file is read through
+    its stripped memory-mapped wordlist index, which is built on first use and already has the empty lines dropped
+    and records whether the dictionary is numbered, so opening it reads nothing but the header."""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        try:
+            self._store = open_wordlist(file_path, strip=True)
+        except Exception as e:
+            raise RuntimeError(f"Error reading {file_path}: {e}")
+        self._numbered = bool(self._store.flags & FLAG_TABBED)
+
+    def __reduce__(self):
+        # Worker processes reopen the mapping instead of receiving the words
+        return DictWords, (self.file_path,)
+
+    def __len__(self):
+        return len(self._store)
+
+    def entry(self, position):
+        """The (word, number) entry at a position, see parse_dict_line."""
+        return parse_dict_line(self._store[position].strip())
+
+    def size(self):
+        """Total bytes of the lines of the file, an upper bound of the bytes of its words."""
+        return self._store.blob_size
+
+    def word_bytes(self, position):
+        """The UTF-8 bytes of the word at a position."""
+        if self._numbered:
+            return self.entry(position)[0].encode("utf-8")
+        return self._store.word_bytes(position)
+
+class EncodedSlot:
+    """The entries of one slot of the product: the words of a DictWords, in file order or in the given order of
+    positions, as UTF-8 bytes followed by the delimiter of the slot. Entries are read lazily and slices are lists."""
+    def __init__(self, words, separator, order=None):
+        self.words = words
+        self.separator = separator
+        self.order = order
+        self._entries = None
+
+    def cache(self, limit):
+        """Keep every entry in memory from now on if they take about limit bytes or less."""
+        if self._entries is None and self.words.size() + len(self) * (ENTRY_OVERHEAD + len(self.separator)) <= limit:
+            self._entries = self[:]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        if self._entries is not None:
+            return self._entries[index]
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if self.order is not None:
+            index = self.order[index]
+        return self.words.word_bytes(index) + self.separator
 
 def load_words_from_dict(file_path):
-    """Load words from a dictionary file (one word per line)."""
+    """Load words from a dictionary file (one word per line, optionally followed by a tab and a count)."""
+    return DictWords(file_path)
+
+def load_scored_words(words, rank_column=False):
+    """Score the words of a DictWords, most likely first. Returns (order, scores): the positions of the words
+    and their log probabilities, both sorted from most to least likely.
+    The number after the tab is a count (or a rank with rank_column, 1 being the most likely); words without
+    one count once or rank after all ranked words. Files without any numbers are taken to be sorted by
+    popularity, so the line number is used as the rank."""
+    # Numbers are positive, so 0 marks a word without one
+    numbers = array.array("d", (words.entry(position)[1] or 0 for position in range(len(words))))
+    if not any(numbers):
+        numbers, rank_column = array.array("d", range(1, len(words) + 1)), True
+    if rank_column:
+        unranked = max(numbers, default=0) + 1
+        weights = array.array("d", (1 / (number or unranked) for number in numbers))
+    else:
+        weights = array.array("d", (number or 1 for number in numbers))
+    total_weight = sum(weights)
+    order = array.array("Q", sorted(range(len(weights)), key=lambda position: -weights[position]))
+    scores = array.array("d", (math.log(weights[position] / total_weight) for position in order))
+    return order, scores
+
+def encode_slots(dict_lists, delimiters, orders=None):
+    """Encode every word, followed by the delimiter of its slot (a newline for the last slot), so a combination
+    is just the concatenation of one entry per slot. The entries are read from the dictionaries as needed."""
+    separators = [delimiter.encode("utf-8") for delimiter in delimiters] + [b"\n"]
+    orders = orders or [None] * len(dict_lists)
+    return [EncodedSlot(words, separator, order) for words, separator, order in zip(dict_lists, separators, orders)]
+
+def unrank_combination(index, sizes):
+    """Convert a combination index into per-slot word indexes (mixed radix, last slot changing fastest),
+    matching the order itertools.product produces."""
+    digits = [0] * len(sizes)
+    for pos in range(len(sizes) - 1, -1, -1):
+        index, digits[pos] = divmod(index, sizes[pos])
+    return digits
+
+def generate_combination_chunk(slots, prepend, start, stop):
+    """Generate combinations [start, stop) of the encoded slots as a single byte buffer.
+    The words of the last slot are joined in one go with everything before them as the separator."""
+    sizes = [len(entries) for entries in slots]
+    digits = unrank_combination(start, sizes)
+    last = slots[-1]
+    parts = []
+    index = start
+    while index < stop:
+        head = prepend + b"".join(entries[digit] for entries, digit in zip(slots[:-1], digits))
+        end = min(len(last), digits[-1] + stop - index)
+        parts.append(head)
+        parts.append(head.join(last[digits[-1]:end]))
+        index += end - digits[-1]
+        # Advance the other slots like an odometer
+        digits[-1] = 0
+        for pos in range(len(slots) - 2, -1, -1):
+            digits[pos] += 1
+            if digits[pos] < sizes[pos]:
+                break
+            digits[pos] = 0
+    return b"".join(parts)
+
+def init_worker(slots, prepend):
+    """Store the encoded dictionaries once per worker process instead of sending them with every task."""
+    global _worker_slots, _worker_prepend
+    slots[-1].cache(LAST_SLOT_CACHE)
+    _worker_slots = slots
+    _worker_prepend = prepend
+
+def expand_chunk(task):
+    """Worker task: combinations [start, stop) as a single byte buffer."""
+    start, stop = task
+    return generate_combination_chunk(_worker_slots, _worker_prepend, start, stop)
+
+def write_combinations(slots, prepend, output_file, start, stop, workers=1, chunk_size=CHUNK_SIZE):
+    """Write combinations [start, stop) to the output file. With several workers the chunks are generated
+    on a process pool and written in order, so the output is the same as a single process run."""
+    tasks = ((chunk_start, min(chunk_start + chunk_size, stop)) for chunk_start in range(start, stop, chunk_size))
+    with open(output_file, "wb") as f:
+        if workers > 1 and stop - start > chunk_size:
+            with multiprocessing.Pool(workers, initializer=init_worker, initargs=(slots, prepend)) as pool:
+                for chunk in pool.imap(expand_chunk, tasks):
+                    f.write(chunk)
+        else:
+            slots[-1].cache(LAST_SLOT_CACHE)
+            for chunk_start, chunk_stop in tasks:
+                f.write(generate_combination_chunk(slots, prepend, chunk_start, chunk_stop))
+
+def combination_size_before(slots, prepend, index):
+    """Exact size in bytes of the first index combinations of the encoded slots, without generating them."""
+    size = len(prepend) * index
+    block = math.prod(len(entries) for entries in slots)
+    for entries in slots:
+        if not entries:
+            return 0
+        # The word of this slot changes every block combinations and cycles through the slot
+        block //= len(entries)
+        blocks, rest = divmod(index, block)
+        cycles, offset = divmod(blocks, len(entries))
+        size += (cycles * sum(len(entry) for entry in entries) + sum(len(entries[i]) for i in range(offset))) * block
+        if offset < len(entries):
+            size += rest * len(entries[offset])
+    return size
+
+def threshold_prefixes(slot_scores, last_negated, threshold):
+    """Yield (digits, score, count) for every combination of the words of all slots but the last that reaches
+    threshold with the best word of the last slot: its per-slot word indexes, its score and how many words of the
+    last slot complete it to a score of at least threshold (always the first ones, as the slots are sorted).
+    last_negated holds the negated scores of the last slot, in ascending order for bisect."""
+    length = len(slot_scores)
+    best_rest = [0.0] * (length + 1)
+    for pos in range(length - 1, -1, -1):
+        best_rest[pos] = best_rest[pos + 1] + slot_scores[pos][0]
+
+    def extend(digits, score, pos):
+        if pos == length - 1:
+            count = bisect.bisect_right(last_negated, score - threshold)
+            if count:
+                yield digits, score, count
+            return
+        for digit, word_score in enumerate(slot_scores[pos]):
+            if score + word_score + best_rest[pos + 1] < threshold:
+                break  # The words after this one score even lower
+            yield from extend(digits + (digit,), score + word_score, pos + 1)
+
+    return extend((), 0.0, 0)
+
+def count_at_least(slot_scores, last_negated, threshold, limit):
+    """Count the combinations scoring at least threshold, stopping as soon as the count passes limit."""
+    count = 0
+    for _, _, completions in threshold_prefixes(slot_scores, last_negated, threshold):
+        count += completions
+        if count > limit:
+            break
+    return count
+
+def top_threshold(slot_scores, last_negated, top):
+    """Bisect for a score threshold that at least top combinations reach, but not many more than that
+    (up to top / TOP_THRESHOLD_SLACK extra), so the combinations above it are the top ones plus a few."""
+    if top >= math.prod(len(scores) for scores in slot_scores):
+        return -math.inf
+    # Every combination reaches low and none reaches high, with a margin for the rounding of the sums
+    low = sum(scores[-1] for scores in slot_scores) - 1
+    high = sum(scores[0] for scores in slot_scores) + 1
+    limit = top + top // TOP_THRESHOLD_SLACK
+    for _ in range(TOP_THRESHOLD_STEPS):
+        middle = (low + high) / 2
+        if middle in (low, high):
+            break
+        count = count_at_least(slot_scores, last_negated, middle, limit)
+        if count < top:
+            high = middle
+        else:
+            low = middle
+            if count <= limit:
+                break
+    return low
+
+def score_sort_key(score, digits):
+    """Sortable record of a combination: the negated score as an order preserving 64-bit integer, then the word
+    indexes, all in hex so the record never holds a newline. Records sort most likely first, ties in slot order."""
+    bits = struct.unpack(">Q", struct.pack(">d", -score))[0]
+    bits = bits ^ 0xFFFFFFFFFFFFFFFF if bits >> 63 else bits | 1 << 63
+    return struct.pack(f">{len(digits) + 1}Q", bits, *digits).hex().encode("ascii")
+
+def generate_top_combinations(slot_scores, top, memory_limit=SORT_MEMORY_LIMIT):
+    """Generate the per-slot word indexes of the top combinations of the slots, given the log probabilities of
+    the words of every slot sorted from most to least likely, in descending joint probability (ties in slot order).
+    A score threshold that about top combinations reach is bisected for first, counting with a pruned depth first
+    search over all slots but the last and a binary search in the last. The combinations above the threshold
+    are then sorted by score with the external sort of wordlist_store, so memory stays bounded by memory_limit
+    however large K and the product are."""
+    if top <= 0 or any(not scores for scores in slot_scores):
+        return
+    last_negated = array.array("d", (-score for score in slot_scores[-1]))
+    threshold = top_threshold(slot_scores, last_negated, top)
+    last_scores = slot_scores[-1]
+    records = (score_sort_key(score + last_scores[digit], digits + (digit,))
+               for digits, score, count in threshold_prefixes(slot_scores, last_negated, threshold)
+               for digit in range(count))
+    digits_format = struct.Struct(f">{len(slot_scores)}Q")
+    for record in itertools.islice(external_sort(records, memory_limit), top):
+        yield digits_format.unpack(bytes.fromhex(record[16:].decode("ascii")))
+
+def write_top_combinations(slots, slot_scores, prepend, output_file, top, block_size=65536):
+    """Write the top combinations of the encoded slots (ordered most likely first, with the log probabilities
+    in slot_scores), most likely first, in blocks of lines."""
+    combinations = generate_top_combinations(slot_scores, top)
+    with open(output_file, "wb") as f:
+        while True:
+            block = [prepend + b"".join(entries[digit] for entries, digit in zip(slots, digits))
+                     for digits in itertools.islice(combinations, block_size)]
+            if not block:
+                break
+            f.write(b"".join(block))
+
+def plan_combinations(slots, prepend, start, stop):
+    """Count the combinations [start, stop) of the encoded slots and their exact output size in bytes."""
+    return stop - start, combination_size_before(slots, prepend, stop) - combination_size_before(slots, prepend, start)
+
+def multiset_permutations(words, length):
+    """Generate every distinct ordering of length of the words. Repeated words are treated as one value
+    with a multiplicity, so no ordering is produced twice. Without repeated words the order is the same
+    as itertools.permutations."""
+    values = list(dict.fromkeys(words))
+    counts = [words.count(value) for value in values]
+    chosen = []
+
+    def extend():
+        if len(chosen) == length:
+            yield tuple(chosen)
+            return
+        for pos, value in enumerate(values):
+            if counts[pos]:
+                counts[pos] -= 1
+                chosen.append(value)
+                yield from extend()
+                chosen.pop()
+                counts[pos] += 1
+
+    return extend()
+
+def plan_permutations(words, delimiters, prepend, min_words, max_words):
+    """Count the distinct orderings of min_words to max_words of the words and their exact output size in bytes,
+    as {length: (count, size)}. The orderings of length r are the ways to interleave k copies of each word
+    into the orderings of the other words, which gives the counts and the word bytes by dynamic programming."""
+    counts, word_bytes = [1] + [0] * max_words, [0] * (max_words + 1)
+    for value in dict.fromkeys(words):
+        copies, value_length = words.count(value), len(value.encode("utf-8"))
+        new_counts, new_word_bytes = [0] * (max_words + 1), [0] * (max_words + 1)
+        for length in range(max_words + 1):
+            for k in range(min(copies, max_words - length) + 1):
+                ways = math.comb(length + k, k)
+                new_counts[length + k] += counts[length] * ways
+                new_word_bytes[length + k] += (word_bytes[length] + counts[length] * k * value_length) * ways
+        counts, word_bytes = new_counts, new_word_bytes
+    delimiter_lengths = [len(delimiter.encode("utf-8")) for delimiter in delimiters]
+    plan = {}
+    for length in range(min_words, max_words + 1):
+        fixed = len(prepend.encode("utf-8")) + sum(delimiter_lengths[:length - 1]) + 1
+        plan[length] = (counts[length], word_bytes[length] + counts[length] * fixed)
+    return plan
+
+def write_permutations(words, delimiters, prepend, output_file, min_words, max_words, block_size=65536):
+    """Write the distinct orderings of min_words to max_words of the words, shortest first, in blocks of lines."""
+    with open(output_file, "w", encoding="utf-8") as f:
+        for length in range(min_words, max_words + 1):
+            gaps = delimiters[:length - 1]
+            permutations = multiset_permutations(words, length)
+            while True:
+                block = [prepend + combo[0] + "".join(delimiter + word for delimiter, word in zip(gaps, combo[1:]))
+                         for combo in itertools.islice(permutations, block_size)]
+                if not block:
+                    break
+                f.write("\n".join(block) + "\n")
+
+def parse_shard(shard, total):
+    """Convert a shard specification 'i/k' (1-based) into the [start, stop) index range of that shard."""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            # Strip whitespace and skip empty lines
-            return [line.strip() for line in f if line.strip()]
-    except Exception as e:
-        raise RuntimeError(f"Error reading {file_path}: {e}")
+        part, parts = (int(value) for value in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected i/k (e.g. 1/4)")
+    if parts < 1 or not 1 <= part <= parts:
+        raise ValueError(f"Invalid shard '{shard}', i must be between 1 and k")
+    return total * (part - 1) // parts, total * part // parts
 
 def main():
     parser = argparse.ArgumentParser(
@@ -34,44 +390,129 @@ def main():
         default="",
         help="Static string to prepend to each output value."
     )
+    parser.add_argument(
+        "--dict",
+        action="append",
+        default=[],
+        help="Path to a dictionary file (one word per line). Repeat for every slot, e.g. --dict a.txt --dict b.txt --dict c.txt."
+    )
     parser.add_argument(
         "--dict1",
-        help="Path to dictionary file 1 (one word per line).",
+        help="Path to dictionary file 1 (one word per line). Same as the first --dict.",
         default=None
     )
     parser.add_argument(
         "--dict2",
-        help="Path to dictionary file 2 (one word per line).",
+        help="Path to dictionary file 2 (one word per line). Same as the second --dict.",
         default=None
     )
     parser.add_argument(
         "--dict3",
-        help="Path to dictionary file 3 (one word per line).",
+        help="Path to dictionary file 3 (one word per line). Same as the third --dict.",
         default=None
     )
+    parser.add_argument(
+        "--slot-delimiter",
+        action="append",
+        help="Delimiter between two slots, repeated once per gap in order (use --slot-delimiter=- for values starting with '-'). Overrides -d."
+    )
+    parser.add_argument("--min-words", type=int, help="With -i, also write the orderings of fewer words, down to this many. Default: --max-words.")
+    parser.add_argument("--max-words", type=int, help="With -i, the number of words in the longest orderings. Default: all words.")
+    parser.add_argument("--skip", type=int, default=0, help="Skip the first N combinations (relative to the shard if --shard is given).")
+    parser.add_argument("--limit", type=int, help="Generate at most M combinations.")
+    parser.add_argument("--shard", type=str, help="Only generate shard i of k equal parts of the keyspace, e.g. 2/4.")
+    parser.add_argument("--top", type=int, help="Only write the K most likely combinations, most likely first, scored by the word<TAB>count column of the dictionaries.")
+    parser.add_argument("--rank-column", action="store_true", help="With --top, the number after the tab is a rank (1 = most likely) instead of a count.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes for dictionary mode. Default: all cores.")
+    add_plan_arguments(parser)
     args = parser.parse_args()
 
+    numbered_dicts = [dict_file for dict_file in (args.dict1, args.dict2, args.dict3) if dict_file]
+    if args.dict and numbered_dicts:
+        parser.error("Use either --dict or --dict1/--dict2/--dict3, not both.")
+    dict_files = args.dict or numbered_dicts
+    if args.skip < 0 or (args.limit is not None and args.limit < 0):
+        parser.error("--skip and --limit must not be negative.")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be at least 1.")
+
     # If any dictionary files are provided, use them in a Cartesian product.
-    if args.dict1 or args.dict2 or args.dict3:
-        dict_lists = []
-        for dict_file in (args.dict1, args.dict2, args.dict3):
-            if dict_file:
-                words = load_words_from_dict(dict_file)
-                dict_lists.append(words)
+    if dict_files:
+        if args.min_words is not None or args.max_words is not None:
+            parser.error("--min-words and --max-words only apply to -i.")
+        if args.top is not None and (args.skip or args.limit is not None or args.shard):
+            parser.error("--top cannot be combined with --skip, --limit or --shard.")
+        delimiters = args.slot_delimiter or [args.delimiter] * (len(dict_files) - 1)
+        if len(delimiters) != len(dict_files) - 1:
+            parser.error(f"--slot-delimiter must be given {len(dict_files) - 1} times, once between every two dictionaries.")
+        prepend = args.prepend.encode("utf-8")
+
+        if args.top is not None:
+            dict_lists = [load_words_from_dict(dict_file) for dict_file in dict_files]
+            orders, slot_scores = zip(*(load_scored_words(words, args.rank_column) for words in dict_lists))
+            slots = encode_slots(dict_lists, delimiters, orders)
+            total = math.prod(len(words) for words in dict_lists)
+            if args.plan:
+                # The size of the top combinations is only known once they are picked, so scale the average line
+                selected = min(args.top, total)
+                size = combination_size_before(slots, prepend, total) * selected // total if total else 0
+                print(f"Total combinations: {total}")
+                print_plan(selected, size, args.output, args.throughput, exact_size=False)
+                return
+            # Produce the most likely combinations first.
+            write_top_combinations(slots, slot_scores, prepend, args.output, args.top)
+            return
+
+        dict_lists = [load_words_from_dict(dict_file) for dict_file in dict_files]
+        slots = encode_slots(dict_lists, delimiters)
+
+        # Work out the slice of the keyspace to generate
+        total = math.prod(len(words) for words in dict_lists)
+        start, stop = 0, total
+        if args.shard:
+            try:
+                start, stop = parse_shard(args.shard, total)
+            except ValueError as e:
+                parser.error(str(e))
+        start = min(start + args.skip, stop)
+        if args.limit is not None:
+            stop = min(stop, start + args.limit)
+
+        if args.plan:
+            if stop - start != total:
+                print(f"Total combinations: {total}")
+            print_plan(*plan_combinations(slots, prepend, start, stop), args.output, args.throughput)
+            return
         # Produce every possible combination: one word from each provided dictionary.
-        combinations = itertools.product(*dict_lists)
+        write_combinations(slots, prepend, args.output, start, stop, args.workers)
+        return
     elif args.input:
+        if args.skip or args.limit is not None or args.shard or args.top is not None:
+            parser.error("--skip, --limit, --shard and --top only apply to dictionary files.")
         words = args.input.split(',')
-        # Produce all possible permutations of the comma-separated words.
-        combinations = itertools.permutations(words, len(words))
+        max_words = len(words) if args.max_words is None else args.max_words
+        min_words = max_words if args.min_words is None else args.min_words
+        if not 1 <= min_words <= max_words <= len(words):
+            parser.error(f"--min-words and --max-words must satisfy 1 <= min <= max <= {len(words)} (the number of words).")
+        delimiters = args.slot_delimiter or [args.delimiter] * (max_words - 1)
+        if len(delimiters) != max_words - 1:
+            parser.error(f"--slot-delimiter must be given {max_words - 1} times, once between every two words.")
+        plan = plan_permutations(words, delimiters, args.prepend, min_words, max_words)
+        total = sum(count for count, _ in plan.values())
+        total_size = sum(size for _, size in plan.values())
+        if len(plan) > 1:
+            for length, (count, size) in plan.items():
+                print(f"{length} words: {count} permutations ({format_file_size(size)})")
+        if args.plan:
+            print_plan(total, total_size, args.output, args.throughput)
+            return
+        print(f"Total permutations: {total}")
+        # Produce every distinct ordering of the comma-separated words, without duplicates for repeated words.
+        write_permutations(words, delimiters, args.prepend, args.output, min_words, max_words)
     else:
-        parser.error("You must provide either a comma separated input (-i) or at least one dictionary file (--dict1, --dict2, or --dict3).")
-    
-    # Write each combination/permutation to the output file with optional prepend and delimiter.
-    with open(args.output, "w", encoding="utf-8") as f:
-        for combo in combinations:
-            line = args.prepend + args.delimiter.join(combo)
-            f.write(line + "\n")
+        parser.error("You must provide either a comma separated input (-i) or at least one dictionary file (--dict).")
 
 if __name__ == "__main__":
     main()
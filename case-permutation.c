@@ -2,56 +2,238 @@
 #include <stdlib.h>
 #include <string.h>
 #include <ctype.h>
+#include <errno.h>
+#include <stdint.h>
+#include <unistd.h>
+#include <pthread.h>
 
-// Compile with gcc -O3 -march=native -o case-permutation case-permutation.c
-// Note that if you stream output to the console, it's extremely slow. Best to write into a file 
+// Compile with gcc -O3 -march=native -pthread -o case-permutation case-permutation.c
+// Build the library used by case-permutation.py --engine native with:
+//   gcc -O3 -march=native -pthread -shared -fPIC -o libcasepermutation.so case-permutation.c
+// Note that if you stream output to the console, it's extremely slow. Best to write into a file
 // Run with: ./case-permutation example outputfile.txt
+//       or: ./case-permutation -f wordlist.txt outputfile.txt
+// Options: -t <threads> (default: all cores), -H (write "Permutations for word:" headers like case-permutation.py)
+//
+// Only letters are toggled and the masks are walked in Gray-code order, so the output is identical to
+// case-permutation.py: line i is the word with the letters selected by the bits of i ^ (i >> 1) uppercased.
 
-#define MAX_LENGTH 24
+#define MAX_INPUT_LENGTH 4096
+#define LINES_PER_CHUNK 65536 // Lines each thread generates before the chunk is written
+#define MAX_CASED 62          // 2^62 lines is already far beyond any disk
+#define MAX_THREADS 256
 
-void printPermutations(FILE *stream, char *word, int index, int length) {
-    if (index == length) { // When index reaches the word length, print the permutation
-        fprintf(stream, "%s\n", word);
-        return;
+typedef struct {
+    const char *lower;      // Lowercased word followed by '\n'
+    const int *positions;   // Index of every letter in the word
+    int cased;              // Number of letters
+    size_t line_length;     // Word length + newline
+    uint64_t start;         // First Gray-code index of the chunk
+    uint64_t end;           // One past the last index
+    char *buffer;
+} chunk_job;
+
+static int write_all(int fd, const char *data, size_t size) {
+    while (size > 0) {
+        ssize_t written = write(fd, data, size);
+        if (written < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            return -1;
+        }
+        data += written;
+        size -= written;
     }
+    return 0;
+}
 
-    // Save the current character
-    char current = word[index];
+static void *fill_chunk(void *arg) {
+    chunk_job *job = arg;
+    char *line = job->buffer;
+    uint64_t gray = job->start ^ (job->start >> 1);
 
-    // Recursively generate permutations with lowercase current letter
-    word[index] = tolower(current);
-    printPermutations(stream, word, index + 1, length);
+    // Build the first line of the chunk from its Gray code, then flip one letter per line
+    memcpy(line, job->lower, job->line_length);
+    for (int bit = 0; bit < job->cased; bit++) {
+        if ((gray >> bit) & 1) {
+            line[job->positions[bit]] ^= 0x20; // Toggling bit 0x20 swaps the case of an ASCII letter
+        }
+    }
+    for (uint64_t i = job->start + 1; i < job->end; i++) {
+        char *next = line + job->line_length;
+        memcpy(next, line, job->line_length);
+        next[job->positions[__builtin_ctzll(i)]] ^= 0x20;
+        line = next;
+    }
+    return NULL;
+}
+
+// Writes every case permutation of word to fd, splitting the mask space across threads.
+// Returns the number of lines written, or -1 on error (errno is set).
+long long write_case_permutations(const char *word, int fd, int threads) {
+    size_t length = strlen(word);
+    size_t line_length = length + 1;
+    long long result = -1;
+    char *lower = malloc(line_length);
+    int *positions = malloc((length ? length : 1) * sizeof(int));
+    char *buffers[MAX_THREADS] = {NULL};
+    chunk_job jobs[MAX_THREADS];
+    pthread_t workers[MAX_THREADS];
+    int started[MAX_THREADS];
+    int cased = 0;
+
+    if (!lower || !positions) {
+        errno = ENOMEM;
+        goto done;
+    }
+    for (size_t i = 0; i < length; i++) {
+        unsigned char c = word[i];
+        lower[i] = tolower(c);
+        if (isalpha(c)) {
+            positions[cased++] = i;
+        }
+    }
+    lower[length] = '\n';
+    if (cased > MAX_CASED) {
+        errno = E2BIG;
+        goto done;
+    }
 
-    // Recursively generate permutations with uppercase current letter
-    // Only if it's different from the lowercase character
-    if (tolower(current) != toupper(current)) {
-        word[index] = toupper(current);
-        printPermutations(stream, word, index + 1, length);
+    uint64_t total = 1ULL << cased;
+    if (threads < 1) {
+        threads = 1;
+    }
+    if (threads > MAX_THREADS) {
+        threads = MAX_THREADS;
+    }
+    if ((uint64_t)threads > (total + LINES_PER_CHUNK - 1) / LINES_PER_CHUNK) {
+        threads = (total + LINES_PER_CHUNK - 1) / LINES_PER_CHUNK;
+    }
+    // A buffer only needs to hold the lines of one chunk, which for short masks is far fewer than LINES_PER_CHUNK
+    size_t chunk_lines = total < LINES_PER_CHUNK ? (size_t)total : LINES_PER_CHUNK;
+    if (line_length > SIZE_MAX / chunk_lines) {
+        errno = ENOMEM;
+        goto done;
+    }
+    for (int t = 0; t < threads; t++) {
+        buffers[t] = malloc(chunk_lines * line_length);
+        if (!buffers[t]) {
+            errno = ENOMEM;
+            goto done;
+        }
     }
 
-    // Restore the character
-    word[index] = current;
+    // Each round every thread fills one chunk; the chunks are then written in order
+    for (uint64_t round_start = 0; round_start < total; round_start += (uint64_t)threads * LINES_PER_CHUNK) {
+        int active = 0;
+        for (int t = 0; t < threads; t++) {
+            uint64_t start = round_start + (uint64_t)t * LINES_PER_CHUNK;
+            if (start >= total) {
+                break;
+            }
+            jobs[t] = (chunk_job){lower, positions, cased, line_length, start,
+                                  start + LINES_PER_CHUNK < total ? start + LINES_PER_CHUNK : total, buffers[t]};
+            active++;
+        }
+        if (active == 1) {
+            fill_chunk(&jobs[0]);
+        } else {
+            for (int t = 0; t < active; t++) {
+                started[t] = pthread_create(&workers[t], NULL, fill_chunk, &jobs[t]) == 0;
+                if (!started[t]) {
+                    fill_chunk(&jobs[t]); // Could not start a thread, do the work here instead
+                }
+            }
+            for (int t = 0; t < active; t++) {
+                if (started[t]) {
+                    pthread_join(workers[t], NULL);
+                }
+            }
+        }
+        for (int t = 0; t < active; t++) {
+            if (write_all(fd, buffers[t], (jobs[t].end - jobs[t].start) * line_length) < 0) {
+                goto done;
+            }
+        }
+    }
+    result = (long long)total;
+
+done:
+    for (int t = 0; t < MAX_THREADS; t++) {
+        free(buffers[t]);
+    }
+    free(lower);
+    free(positions);
+    return result;
+}
+
+static int process_word(const char *word, int fd, int threads, int headers) {
+    if (headers) {
+        char header[MAX_INPUT_LENGTH + 32];
+        int size = snprintf(header, sizeof(header), "Permutations for word: %s\n", word);
+        if (size < 0 || (size_t)size >= sizeof(header) || write_all(fd, header, size) < 0) {
+            return -1;
+        }
+    }
+    if (write_case_permutations(word, fd, threads) < 0) {
+        return -1;
+    }
+    return headers ? write_all(fd, "\n", 1) : 0;
+}
+
+static char *strip(char *text) {
+    char *end = text + strlen(text);
+    while (isspace((unsigned char)*text)) {
+        text++;
+    }
+    while (end > text && isspace((unsigned char)end[-1])) {
+        end--;
+    }
+    *end = '\0';
+    return text;
 }
 
 int main(int argc, char *argv[]) {
-    char word[MAX_LENGTH + 1]; // +1 for the null terminator
-    FILE *output_stream = stdout; // Default to stdout
+    char word[MAX_INPUT_LENGTH + 1];
+    const char *wordlist = NULL;
+    int threads = (int)sysconf(_SC_NPROCESSORS_ONLN);
+    int headers = 0;
+    int opt;
 
-    if (argc >= 2) {
-        strncpy(word, argv[1], MAX_LENGTH);
-        word[MAX_LENGTH] = '\0'; // Ensure null-termination
-    } else {
-        printf("Please enter the word (up to %d characters): ", MAX_LENGTH);
-        if (fgets(word, sizeof(word), stdin) == NULL) {
-            perror("Error reading input");
+    while ((opt = getopt(argc, argv, "f:t:H")) != -1) {
+        switch (opt) {
+        case 'f':
+            wordlist = optarg;
+            break;
+        case 't':
+            threads = atoi(optarg);
+            break;
+        case 'H':
+            headers = 1;
+            break;
+        default:
+            fprintf(stderr, "Usage: %s [-t threads] [-H] [-f wordlist | word] [outputfile]\n", argv[0]);
             return EXIT_FAILURE;
         }
-        word[strcspn(word, "\n")] = 0; // Remove newline character
     }
 
-    int length = strlen(word);
+    if (!wordlist) {
+        if (optind < argc) {
+            strncpy(word, argv[optind++], MAX_INPUT_LENGTH);
+            word[MAX_INPUT_LENGTH] = '\0'; // Ensure null-termination
+        } else {
+            printf("Please enter the word (up to %d characters): ", MAX_INPUT_LENGTH);
+            if (fgets(word, sizeof(word), stdin) == NULL) {
+                perror("Error reading input");
+                return EXIT_FAILURE;
+            }
+            word[strcspn(word, "\n")] = 0; // Remove newline character
+        }
+    }
 
-    char *output_file = argc >= 3 ? argv[2] : NULL;
+    char *output_file = optind < argc ? argv[optind] : NULL;
+    FILE *output_stream = stdout; // Default to stdout
 
     if (output_file) {
         output_stream = fopen(output_file, "w");
@@ -60,15 +242,40 @@ int main(int argc, char *argv[]) {
             return EXIT_FAILURE;
         }
     }
+    fflush(stdout);
+    int fd = fileno(output_stream);
+    int status = EXIT_SUCCESS;
 
     // Generate and print/write permutations
-    printPermutations(output_stream, word, 0, length);
+    if (wordlist) {
+        FILE *input = fopen(wordlist, "r");
+        char *line = NULL;
+        size_t capacity = 0;
+        if (!input) {
+            perror("Error opening wordlist");
+            return EXIT_FAILURE;
+        }
+        while (getline(&line, &capacity, input) != -1) {
+            char *entry = strip(line);
+            if (*entry && process_word(entry, fd, threads, headers) < 0) {
+                perror("Error writing permutations");
+                status = EXIT_FAILURE;
+                break;
+            }
+        }
+        free(line);
+        fclose(input);
+    } else if (process_word(word, fd, threads, headers) < 0) {
+        perror("Error writing permutations");
+        status = EXIT_FAILURE;
+    }
 
     if (output_stream != stdout) {
         fclose(output_stream);
-        printf("Permutations written to %s\n", output_file);
+        if (status == EXIT_SUCCESS) {
+            printf("Permutations written to %s\n", output_file);
+        }
     }
 
-    return EXIT_SUCCESS;
+    return status;
 }
-
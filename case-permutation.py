@@ -1,24 +1,94 @@
 import itertools
 import argparse
+import ctypes
+import os
 import sys
 
+from keyspace_planner import add_plan_arguments, print_plan, product_keyspace
+
+# Number of permutations collected before each write
+BLOCK_SIZE = 65536
+
+# Shared library built from case-permutation.c, see the README for the build command
+NATIVE_LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libcasepermutation.so')
+
+def load_native_engine(path=NATIVE_LIBRARY):
+    """Load the native engine from case-permutation.c, or return None if the library has not been built."""
+    try:
+        library = ctypes.CDLL(path, use_errno=True)
+    except OSError:
+        return None
+    library.write_case_permutations.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int]
+    library.write_case_permutations.restype = ctypes.c_longlong
+    return library
+
+def cased_positions(word):
+    """Positions of the characters that have an upper and lower case form."""
+    return [i for i, c in enumerate(word) if c.upper() != c.lower()]
+
 def generate_permutations(word):
-    return map(''.join, itertools.product(*((c.upper(), c.lower()) for c in word)))
+    """Generate every case permutation of the word, starting from all lowercase.
+    Only cased characters are toggled, so no permutation is produced twice, and the masks are
+    walked in Gray-code order so each permutation differs from the previous one in one character."""
+    positions = cased_positions(word)
+    current = [c.lower() for c in word]
+    yield ''.join(current)
+    for i in range(1, 1 << len(positions)):
+        pos = positions[(i & -i).bit_length() - 1]
+        current[pos] = word[pos].upper() if current[pos] == word[pos].lower() else word[pos].lower()
+        yield ''.join(current)
 
-def process_word(word, output_handle=None):
-    # Generate the permutations for the word
-    perms = generate_permutations(word)
-    header = f"Permutations for word: {word}\n"
-    if output_handle:
-        output_handle.write(header)
-        for p in perms:
-            output_handle.write(p + '\n')
-        output_handle.write('\n')
+def generate_permutation_blocks(word, block_size=BLOCK_SIZE):
+    """Generate the permutations of the word as blocks of newline terminated bytes.
+    ASCII words are permuted in place in a reused bytearray, flipping one byte per permutation."""
+    if not word.isascii():
+        perms = generate_permutations(word)
+        while True:
+            block = list(itertools.islice(perms, block_size))
+            if not block:
+                return
+            yield ('\n'.join(block) + '\n').encode('utf-8')
+
+    positions = cased_positions(word)
+    line = bytearray(word.lower().encode('ascii') + b'\n')
+    block = bytearray(line)
+    for i in range(1, 1 << len(positions)):
+        # Toggling bit 0x20 swaps the case of an ASCII letter
+        line[positions[(i & -i).bit_length() - 1]] ^= 0x20
+        block += line
+        if i % block_size == block_size - 1:
+            yield bytes(block)
+            block = bytearray()
+    if block:
+        yield bytes(block)
+
+def plan_word(word, plain=False):
+    """Count the permutations of a word and the exact bytes written for it, including the header and blank line unless plain."""
+    choices = [{c.lower(), c.upper()} for c in word]
+    count, length = product_keyspace([[len(option.encode('utf-8')) for option in options] for options in choices])
+    size = length + count
+    if not plain:
+        size += len(f"Permutations for word: {word}\n".encode('utf-8')) + 1
+    return count, size
+
+def process_word(word, output_handle=None, plain=False, native=None, threads=1):
+    # Generate the permutations for the word and write them in large blocks
+    out = output_handle or sys.stdout.buffer
+    if not plain:
+        out.write(f"Permutations for word: {word}\n".encode('utf-8'))
+    # The native engine only toggles ASCII letters, other words always use the python engine
+    if native and word.isascii():
+        out.flush()
+        if native.write_case_permutations(word.encode('ascii'), out.fileno(), threads) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
     else:
-        print(header, end='')
-        for p in perms:
-            print(p)
-        print()
+        for block in generate_permutation_blocks(word):
+            out.write(block)
+    if not plain:
+        out.write(b'\n')
+    if not output_handle:
+        out.flush()
 
 def main():
     parser = argparse.ArgumentParser(
@@ -29,21 +99,47 @@ def main():
     group.add_argument("-w", "--word", help="Input word")
     group.add_argument("-f", "--file", help="File containing list of words (one per line)")
     parser.add_argument("-o", "--output", help="Output file to write permutations", type=str)
-    
+    parser.add_argument("--engine", choices=["python", "native"], default="python", help="Permutation engine. native uses the shared library built from case-permutation.c and falls back to python if it is not built")
+    parser.add_argument("-t", "--threads", type=int, default=os.cpu_count(), help="Threads used by the native engine (default: number of CPUs)")
+    parser.add_argument("--plain", action="store_true", help="Only output the permutations, without the 'Permutations for word:' headers and blank separator lines")
+    add_plan_arguments(parser)
+
     args = parser.parse_args()
+
+    if args.plan:
+        if args.word:
+            words = [args.word]
+        elif args.file:
+            try:
+                with open(args.file, 'r') as f:
+                    words = [line.strip() for line in f if line.strip()]
+            except Exception as e:
+                print(f"Error reading file {args.file}: {e}")
+                sys.exit(1)
+        else:
+            words = [input("Please enter the word: ").strip()]
+        plans = [plan_word(word, args.plain) for word in words if word]
+        print_plan(sum(count for count, _ in plans), sum(size for _, size in plans), args.output, args.throughput)
+        return
     
+    native = None
+    if args.engine == "native":
+        native = load_native_engine()
+        if native is None:
+            print(f"Native library {NATIVE_LIBRARY} not found, falling back to the python engine.")
+
     # Determine output handle if an output file is provided
     output_handle = None
     if args.output:
         try:
-            output_handle = open(args.output, 'w')
+            output_handle = open(args.output, 'wb')
         except Exception as e:
             print(f"Error opening output file {args.output}: {e}")
             sys.exit(1)
 
     # Process a single word if provided via -w
     if args.word:
-        process_word(args.word, output_handle)
+        process_word(args.word, output_handle, args.plain, native, args.threads)
     # Process words from a file if provided via -f
     elif args.file:
         try:
@@ -51,7 +147,7 @@ def main():
                 for line in f:
                     word = line.strip()
                     if word:  # skip empty lines
-                        process_word(word, output_handle)
+                        process_word(word, output_handle, args.plain, native, args.threads)
         except Exception as e:
             print(f"Error reading file {args.file}: {e}")
             sys.exit(1)
@@ -59,7 +155,7 @@ def main():
     else:
         word = input("Please enter the word: ").strip()
         if word:
-            process_word(word, output_handle)
+            process_word(word, output_handle, args.plain, native, args.threads)
         else:
             print("No valid input provided.")
             sys.exit(1)
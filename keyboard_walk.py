@@ -1,4 +1,85 @@
 import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from keyspace_planner import add_plan_arguments, format_file_size, print_plan
+
+# Prefixes are made this many steps shorter than the walks, which keeps each task to about 8^6 walks
+TASK_WALK_STEPS = 6
+
+# Prefixes are made deeper until every worker gets at least this many of them, which keeps the pool balanced
+TASKS_PER_WORKER = 16
+
+# ... but kept shallow enough that a job never has more than about this many prefixes to hand out and track
+MAX_TASKS = 100000
+
+# Minimum number of seconds between manifest updates
+MANIFEST_INTERVAL = 1.0
+
+# Keyboard layouts as rows of keys; keys are adjacent if they touch horizontally, vertically or diagonally
+KEYBOARD_LAYOUTS = {
+    "qwerty": [
+        ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '='],
+        ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
+        ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
+        ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
+    ],
+    "qwertyshifted": [
+        ['~', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '_', '+'],
+        ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '='],
+        ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
+        ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
+        ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
+    ],
+    "qwertyshifted1": [
+        ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '='],
+        ['~', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '_', '+'],
+        ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
+        ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
+        ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
+    ],
+    "qwertyshifted2": [
+        ['~', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '_', '+'],
+        ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
+        ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
+        ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
+    ],
+    "dvorak": [
+        ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '[', ']'],
+        ['\'', ',', '.', 'p', 'y', 'f', 'g', 'c', 'r', 'l', '/', '=', '\\'],
+        ['a', 'o', 'e', 'u', 'i', 'd', 'h', 't', 'n', 's', '-'],
+        [';', 'q', 'j', 'k', 'x', 'b', 'm', 'w', 'v', 'z'],
+    ],
+    "azerty": [
+        ['²', '&', 'é', '"', '\'', '(', '-', 'è', '_', 'ç', 'à', ')', '=', '\\'],
+        ['a', 'z', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '^', '$'],
+        ['q', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'm', 'ù', '*'],
+        ['<', 'w', 'x', 'c', 'v', 'b', 'n', ',', ';', ':', '!'],
+    ]
+}
+
+# Layouts that can switch to a shift layer, with the grid that holds the shifted form of their top row
+SHIFT_LAYERS = {"qwerty": "qwertyshifted2"}
+
+# Step directions as (row, column) offsets on the layout grid
+DIRECTIONS = {
+    (0, -1): "left", (0, 1): "right", (-1, 0): "up", (1, 0): "down",
+    (-1, -1): "up-left", (-1, 1): "up-right", (1, -1): "down-left", (1, 1): "down-right",
+}
+DIRECTION_GROUPS = {
+    "horizontal": ["left", "right"],
+    "vertical": ["up", "down"],
+    "diagonal": ["up-left", "up-right", "down-left", "down-right"],
+}
+
+# Pruning rules applied while walking; None / False means the rule is off
+WalkConstraints = namedtuple("WalkConstraints", ["max_turns", "no_revisit", "min_run", "directions", "shift_switches"],
+                             defaults=[None, False, None, None, None])
 
 def get_adjacent_keys(key, keyboard):
     """Find all adjacent keys for a given key."""
@@ -13,90 +94,573 @@ def get_adjacent_keys(key, keyboard):
                             adjacent.append(keyboard[i + x][j + y])
     return adjacent
 
-def generate_walks(start_key, length, keyboard, path="", walks=None):
-    """Recursively generate all walks of a given length starting from a specific key."""
-    if walks is None:
-        walks = []
-
-    if length == 0:
-        walks.append(path)
-        return walks
-
-    for adj_key in get_adjacent_keys(start_key, keyboard):
-        generate_walks(adj_key, length - 1, keyboard, path + adj_key, walks)
-
-    return walks
-
-def keyboard_walks(length, layout):
-    """Generate all keyboard walks of a specified length for a given layout."""
-    layouts = {
-        "qwerty": [
-            ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '='],
-            ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
-            ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
-            ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
-        ],
-        "qwertyshifted": [
-            ['~', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '_', '+'],
-            ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '='],
-            ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
-            ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
-            ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
-        ],
-        "qwertyshifted1": [
-            ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '='],
-            ['~', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '_', '+'],
-            ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
-            ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
-            ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
-        ],
-        "qwertyshifted2": [
-            ['~', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '_', '+'],
-            ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '[', ']', '\\'],
-            ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', ';', '\''],
-            ['z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/'],
-        ],
-        "dvorak": [
-            ['`', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '[', ']'],
-            ['\'', ',', '.', 'p', 'y', 'f', 'g', 'c', 'r', 'l', '/', '=', '\\'],
-            ['a', 'o', 'e', 'u', 'i', 'd', 'h', 't', 'n', 's', '-'],
-            [';', 'q', 'j', 'k', 'x', 'b', 'm', 'w', 'v', 'z'],
-        ],
-        "azerty": [
-            ['²', '&', 'é', '"', '\'', '(', '-', 'è', '_', 'ç', 'à', ')', '=', '\\'],
-            ['a', 'z', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p', '^', '$'],
-            ['q', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l', 'm', 'ù', '*'],
-            ['<', 'w', 'x', 'c', 'v', 'b', 'n', ',', ';', ':', '!'],
-        ]
-    }
-
-    keyboard = layouts[layout]
-
-    all_walks = []
+def compile_layout(keyboard):
+    """Compile a layout once into key indexes: returns (keys, adjacency, starts) where adjacency[i]
+    lists the indexes of the keys adjacent to keys[i] and starts lists the start key of every grid cell."""
+    keys = []
+    index = {}
     for row in keyboard:
         for key in row:
-            all_walks.extend(generate_walks(key, length - 1, keyboard, key))
+            if key not in index:
+                index[key] = len(keys)
+                keys.append(key)
+    adjacency = [[index[adj_key] for adj_key in get_adjacent_keys(key, keyboard)] for key in keys]
+    starts = [index[key] for row in keyboard for key in row]
+    return keys, adjacency, starts
+
+def compile_directions(keyboard, keys, adjacency):
+    """For every key index, the direction name of each step in its adjacency list."""
+    positions = {key: (i, j) for i, row in enumerate(keyboard) for j, key in enumerate(row)}
+    directions = []
+    for node, adj_list in enumerate(adjacency):
+        row, column = positions[keys[node]]
+        directions.append([DIRECTIONS[(positions[keys[adj]][0] - row, positions[keys[adj]][1] - column)] for adj in adj_list])
+    return directions
+
+def shifted_keys(layout):
+    """Map every key of the layout to the character typed with shift held, or None when it is not known.
+    The shifted top row comes from the matching qwertyshifted grid and letters shift to uppercase."""
+    mapping = {}
+    for base_row, shifted_row in zip(KEYBOARD_LAYOUTS[layout], KEYBOARD_LAYOUTS[SHIFT_LAYERS[layout]]):
+        for key, shifted_key in zip(base_row, shifted_row):
+            if shifted_key != key:
+                mapping[key] = shifted_key
+            elif key.upper() != key:
+                mapping[key] = key.upper()
+    return mapping
+
+def parse_directions(value):
+    """Parse a comma separated list of direction names or groups (horizontal, vertical, diagonal)."""
+    directions = set()
+    for name in value.split(","):
+        name = name.strip().lower()
+        if name in DIRECTION_GROUPS:
+            directions.update(DIRECTION_GROUPS[name])
+        elif name in DIRECTIONS.values():
+            directions.add(name)
+        else:
+            raise argparse.ArgumentTypeError(f"unknown direction '{name}'")
+    return frozenset(directions)
+
+def is_constrained(constraints):
+    """Whether any pruning rule is switched on."""
+    return constraints is not None and constraints != WalkConstraints()
+
+@lru_cache(maxsize=None)
+def compile_constrained_layout(layout, constraints):
+    """Compile a layout for constrained walking: returns (layers, adjacency, directions, starts) where
+    layers[0] holds the keys and layers[1], with shift switching, their shifted characters (or None)."""
+    keyboard = KEYBOARD_LAYOUTS[layout]
+    keys, adjacency, starts = compile_layout(keyboard)
+    layers = [keys]
+    if constraints.shift_switches is not None:
+        shifted = shifted_keys(layout)
+        layers.append([shifted.get(key) for key in keys])
+    return layers, adjacency, compile_directions(keyboard, keys, adjacency), starts
+
+def next_steps(node, layer, direction, run, turns, switches, visited, graph, constraints):
+    """Yield every allowed next (node, layer, direction, run, turns, switches) state of a walk.
+    Steps that break a rule are cut here, so their whole subtree is never visited."""
+    layers, adjacency, directions, _ = graph
+    for adj, step in zip(adjacency[node], directions[node]):
+        if constraints.directions is not None and step not in constraints.directions:
+            continue
+        if constraints.no_revisit and adj in visited:
+            continue
+        if constraints.max_turns is None and not constraints.min_run:
+            # Without turn rules the direction does not matter, which keeps the walk states few
+            new_direction, new_run, new_turns = None, 0, 0
+        else:
+            new_direction, new_run, new_turns = step, run + 1, turns
+            if direction is not None and step != direction:
+                if constraints.min_run and run < constraints.min_run:
+                    continue
+                new_run, new_turns = 1, turns + 1
+                if constraints.max_turns is not None and new_turns > constraints.max_turns:
+                    continue
+            if constraints.min_run:
+                new_run = min(new_run, constraints.min_run)  # Longer runs all behave the same
+        for new_layer in range(len(layers)):
+            if layers[new_layer][adj] is None:
+                continue
+            new_switches = switches + (new_layer != layer)
+            if constraints.shift_switches is not None and new_switches > constraints.shift_switches:
+                continue
+            yield adj, new_layer, new_direction, new_run, new_turns, new_switches
+
+def run_complete(direction, run, constraints):
+    """Whether a walk may end here: its final straight run must also reach the minimum run length."""
+    return not constraints.min_run or direction is None or run >= constraints.min_run
+
+def extend_constrained_walks(path, state, size, min_length, max_length, visited, graph, constraints):
+    """Lazily generate, depth first, the walks of min_length to max_length keys that extend a partial walk of
+    size keys and satisfy the constraints. Each walk is yielded as (length, walk) right before its extensions."""
+    if size >= min_length and run_complete(state[2], state[3], constraints):
+        yield size, path
+    if size == max_length:
+        return
+    layers = graph[0]
+    for next_state in next_steps(*state, visited, graph, constraints):
+        adj, new_layer = next_state[0], next_state[1]
+        visited.add(adj)
+        yield from extend_constrained_walks(path + layers[new_layer][adj], next_state, size + 1, min_length, max_length, visited, graph, constraints)
+        visited.discard(adj)
+
+def make_completion_counter(graph, constraints):
+    """Build a function counting the completions of a partial walk and the total bytes of the keys they add.
+    Completions are memoised on the walk state; with --no-revisit the visited keys are part of the state,
+    so those walks are counted by a plain depth first search instead."""
+    layers = graph[0]
+    memo = {}
+
+    def completions(state, remaining, visited):
+        if remaining == 0:
+            return (1, 0) if run_complete(state[2], state[3], constraints) else (0, 0)
+        key = None
+        if not constraints.no_revisit:
+            key = (state, remaining)
+            if key in memo:
+                return memo[key]
+        count, size = 0, 0
+        for next_state in next_steps(*state, visited, graph, constraints):
+            adj, new_layer = next_state[0], next_state[1]
+            visited.add(adj)
+            sub_count, sub_size = completions(next_state, remaining - 1, visited)
+            visited.discard(adj)
+            count += sub_count
+            size += sub_size + sub_count * len(layers[new_layer][adj].encode('utf-8'))
+        if key is not None:
+            memo[key] = (count, size)
+        return count, size
+
+    return completions
+
+@lru_cache(maxsize=None)
+def completion_counter(layout, constraints):
+    """The completion counter of a layout and constraints, shared by every count in this process so
+    its memo carries over from one prefix to the next."""
+    return make_completion_counter(compile_constrained_layout(layout, constraints), constraints)
+
+def walk_prefixes(layout, constraints, depth):
+    """Yield, in output order, every walk prefix of depth steps as a tuple of (key index, layer)."""
+    graph = compile_constrained_layout(layout, constraints)
+    layers = graph[0]
+
+    def extend(prefix, state, visited):
+        if len(prefix) == depth + 1:
+            yield prefix
+            return
+        for next_state in next_steps(*state, visited, graph, constraints):
+            visited.add(next_state[0])
+            yield from extend(prefix + ((next_state[0], next_state[1]),), next_state, visited)
+            visited.discard(next_state[0])
+
+    for start in graph[3]:
+        for layer in range(len(layers)):
+            if layers[layer][start] is not None:
+                yield from extend(((start, layer),), (start, layer, None, 0, 0, 0), {start})
+
+def replay_prefix(prefix, graph, constraints):
+    """Rebuild the walk (path, state, visited keys) at the end of a prefix from walk_prefixes."""
+    layers = graph[0]
+    node, layer = prefix[0]
+    path = layers[layer][node]
+    state = (node, layer, None, 0, 0, 0)
+    visited = {node}
+    for node, layer in prefix[1:]:
+        state = next(step for step in next_steps(*state, visited, graph, constraints) if step[:2] == (node, layer))
+        visited.add(node)
+        path += layers[layer][node]
+    return path, state, visited
+
+def continue_walks(node, path, size, min_length, max_length, keys, adjacency):
+    """Lazily generate, depth first, the unconstrained walks of min_length to max_length keys that extend a partial
+    walk of size keys ending on a key index. Every walk is emitted right before its extensions, so each shorter
+    walk is built once and shared by all the longer ones. Batches are yielded as (length, walks); the longest
+    walks come in batches of the walks that only differ in their last key."""
+    neighbour_keys = [[keys[adj] for adj in adj_list] for adj_list in adjacency]
+    stack = [(node, path, size)]
+    while stack:
+        node, path, size = stack.pop()
+        if size >= min_length:
+            yield size, [path]
+        if size == max_length - 1:
+            yield max_length, [path + key for key in neighbour_keys[node]]
+        elif size < max_length:
+            # Push in reverse so the walks come out in adjacency order
+            for adj in reversed(adjacency[node]):
+                stack.append((adj, path + keys[adj], size + 1))
+
+def prefix_walk_batches(length, layout, constraints, prefix, min_length=None, batch_size=4096):
+    """Lazily generate, in batches of (length, walks), all keyboard walks of min_length (default: length)
+    to length keys that start with the prefix."""
+    min_length = min_length or length
+    graph = compile_constrained_layout(layout, constraints)
+    path, state, visited = replay_prefix(prefix, graph, constraints)
+    if not is_constrained(constraints):
+        yield from continue_walks(state[0], path, len(prefix), min_length, length, graph[0][0], graph[1])
+        return
+    batch_length, batch = None, []
+    for walk_length, walk in extend_constrained_walks(path, state, len(prefix), min_length, length, visited, graph, constraints):
+        if walk_length != batch_length or len(batch) == batch_size:
+            if batch:
+                yield batch_length, batch
+            batch_length, batch = walk_length, []
+        batch.append(walk)
+    if batch:
+        yield batch_length, batch
 
-    return all_walks
+def keyboard_walk_batches(length, layout, constraints=None, min_length=None):
+    """Lazily generate all keyboard walks of min_length (default: length) to length keys for a given layout,
+    in batches of (length, walks)."""
+    constraints = constraints or WalkConstraints()
+    if length < 1:
+        return
+    for prefix in walk_prefixes(layout, constraints, 0):
+        yield from prefix_walk_batches(length, layout, constraints, prefix, min_length)
+
+def keyboard_walks(length, layout, constraints=None, min_length=None):
+    """Lazily generate all keyboard walks of min_length (default: length) to length keys for a given layout."""
+    for _, batch in keyboard_walk_batches(length, layout, constraints, min_length):
+        yield from batch
+
+def task_walk_batches(length, layout, constraints, prefix, min_length):
+    """The walk batches of one task: the walks under the prefix or, for the empty prefix,
+    every walk shorter than the prefixes (length is then the prefix depth)."""
+    if prefix:
+        return prefix_walk_batches(length, layout, constraints, prefix, min_length)
+    return keyboard_walk_batches(length, layout, constraints, min_length)
+
+def task_walk_chunks(task):
+    """Lazily generate the walks of one task as newline terminated UTF-8 byte chunks of (output key, bytes),
+    keyed by walk length when every length has its own file and by None otherwise."""
+    length, min_length, layout, constraints, prefix, split_lengths = task
+    for walk_length, batch in task_walk_batches(length, layout, constraints, prefix, min_length):
+        yield walk_length if split_lengths else None, ('\n'.join(batch) + '\n').encode('utf-8')
+
+def render_prefix(task):
+    """Worker task: stream the walks under one prefix to part files next to each other,
+    one per output, and return them as {output key: part file}."""
+    *walk_task, part_base = task
+    part_files, files = {}, {}
+    try:
+        for key, chunk in task_walk_chunks(walk_task):
+            if key not in files:
+                part_files[key] = f"{part_base}.{'all' if key is None else key}"
+                files[key] = open(part_files[key], "wb")
+            files[key].write(chunk)
+    finally:
+        for file in files.values():
+            file.close()
+    return part_files
+
+def default_prefix_depth(length, layout, workers=1):
+    """Prefix depth that leaves about TASK_WALK_STEPS steps of walking in every task without going past
+    MAX_TASKS prefixes, then made deeper while there are fewer than TASKS_PER_WORKER prefixes per worker.
+    The number of prefixes is estimated by the unconstrained walk counts. Shards must split the same prefix
+    list on every machine, so they pass workers=1 (see job_prefix_depth)."""
+    if length < 2:
+        return 0
+    counts = count_walks_by_length(length, layout, min_length=1)
+    depth = max(1, length - 1 - TASK_WALK_STEPS)
+    while depth > 1 and counts[depth + 1][0] > MAX_TASKS:
+        depth -= 1
+    while depth < length - 1 and counts[depth + 1][0] < TASKS_PER_WORKER * workers:
+        depth += 1
+    return depth
+
+def job_prefix_depth(length, layout, workers=1, shard=None):
+    """Default prefix depth of a job. With a shard it does not depend on the worker count, so machines with
+    different core counts still split the same prefixes."""
+    return default_prefix_depth(length, layout, 1 if shard else workers)
+
+def task_length(prefix, length, depth):
+    """The longest walk of a task: length for a prefix, and the prefix depth for the task of shorter walks."""
+    return length if prefix else depth
+
+def length_output_file(output_file, length):
+    """Output file of one walk length with --split-lengths, e.g. walks.txt -> walks.8.txt."""
+    root, extension = os.path.splitext(output_file)
+    return f"{root}.{length}{extension}"
+
+def parse_shard(value):
+    """Parse a shard specification 'i/k' (1-based) into (i, k)."""
+    try:
+        part, parts = (int(number) for number in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected i/k (e.g. 1/4)")
+    if parts < 1 or not 1 <= part <= parts:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', i must be between 1 and k")
+    return part, parts
+
+def shard_prefixes(min_length, layout, constraints, depth, shard=None):
+    """The prefixes of a job in output order. When walks of min_length are shorter than the prefixes, they come
+    first as a task of their own, under the empty prefix. Shard i/k takes every k-th prefix starting at the i-th,
+    so separate machines split the same job deterministically and get similar amounts of work."""
+    prefixes = list(walk_prefixes(layout, constraints, depth))
+    if min_length <= depth:
+        prefixes.insert(0, ())
+    if shard is None:
+        return prefixes
+    part, parts = shard
+    return [prefix for number, prefix in enumerate(prefixes) if number % parts == part - 1]
+
+def count_prefix_walks(length, layout, constraints, prefixes, min_length=None):
+    """Count the walks of every length from min_length (default: length) to length under the given prefixes
+    and their exact output size in bytes (including newlines), as {length: (walks, size)}.
+    The completion counts are memoised across lengths, so the longest length dominates the cost."""
+    min_length = min_length or length
+    graph = compile_constrained_layout(layout, constraints)
+    completions = completion_counter(layout, constraints)
+    totals = {walk_length: (0, 0) for walk_length in range(min_length, length + 1)}
+    for prefix in prefixes:
+        path, state, visited = replay_prefix(prefix, graph, constraints)
+        path_size = len(path.encode('utf-8')) + 1
+        for walk_length in range(max(min_length, len(prefix)), length + 1):
+            count, size = completions(state, walk_length - len(prefix), visited)
+            total_walks, total_size = totals[walk_length]
+            totals[walk_length] = (total_walks + count, total_size + size + count * path_size)
+    return totals
+
+def count_prefix_task(task):
+    """Worker task: the walk counts of count_prefix_walks under one prefix (see task_walk_batches)."""
+    length, min_length, layout, constraints, prefix = task
+    if not prefix:
+        return count_walks_by_length(length, layout, constraints, min_length)
+    return count_prefix_walks(length, layout, constraints, [prefix], min_length)
+
+def count_job_walks(length, layout, constraints, prefixes, depth, min_length=None, workers=1):
+    """Count the walks under the prefixes like count_prefix_walks, one prefix per task on a process pool.
+    With --no-revisit the completions cannot be memoised, so this spreads the depth first count over all cores."""
+    min_length = min_length or length
+    totals = {walk_length: (0, 0) for walk_length in range(min_length, length + 1)}
+    tasks = ((task_length(prefix, length, depth), min_length, layout, constraints, prefix) for prefix in prefixes)
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap_unordered(count_prefix_task, tasks, chunksize=16) if pool else map(count_prefix_task, tasks)
+        for counts in results:
+            for walk_length, (count, size) in counts.items():
+                total_walks, total_size = totals[walk_length]
+                totals[walk_length] = (total_walks + count, total_size + size)
+    finally:
+        if pool:
+            pool.terminate()
+    return totals
+
+def job_description(length, layout, constraints, depth, shard, min_length, split_lengths):
+    """JSON friendly description of a job, stored in the manifest to check a resume matches it."""
+    rules = constraints._asdict()
+    if rules["directions"] is not None:
+        rules["directions"] = sorted(rules["directions"])
+    return {"length": length, "min_length": min_length, "split_lengths": split_lengths, "layout": layout,
+            "constraints": rules, "prefix_depth": depth, "shard": list(shard) if shard else None}
+
+def save_manifest(manifest_file, manifest):
+    """Atomically write the manifest so a crash never leaves a half written file."""
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
+
+def prefix_done(manifest_file, manifest, files, last_save):
+    """Count one more finished prefix and, at most every MANIFEST_INTERVAL seconds, save the manifest
+    with the current ends of the output files. Returns the time of the last save."""
+    manifest["prefixes_done"] += 1
+    if time.monotonic() - last_save < MANIFEST_INTERVAL:
+        return last_save
+    for file in files:
+        file.flush()
+    manifest["offsets"] = [file.tell() for file in files]
+    save_manifest(manifest_file, manifest)
+    return time.monotonic()
+
+def write_walks(length, layout, output_file, constraints=None, workers=1, depth=None, shard=None, resume=False,
+                min_length=None, split_lengths=False):
+    """Generate the walks of every prefix of the job on a process pool and stream them to the output file.
+    With min_length, every length from min_length to length comes out of the same depth first pass, either
+    interleaved in output_file or, with split_lengths, in one file per length (see length_output_file).
+    Workers stream every prefix to part files that are appended in prefix order, so memory stays flat and the
+    output matches a serial run, which writes straight to the outputs. The manifest
+    (<output>.manifest) records how many prefixes are done and where the outputs end, so an
+    interrupted run can resume without redoing finished prefixes."""
+    constraints = constraints or WalkConstraints()
+    min_length = min_length or length
+    depth = job_prefix_depth(length, layout, workers, shard) if depth is None else min(depth, length - 1)
+    prefixes = shard_prefixes(min_length, layout, constraints, depth, shard)
+    if split_lengths:
+        outputs = [(walk_length, length_output_file(output_file, walk_length)) for walk_length in range(min_length, length + 1)]
+    else:
+        outputs = [(None, output_file)]
+    manifest_file = output_file + ".manifest"
+    manifest = {"job": job_description(length, layout, constraints, depth, shard, min_length, split_lengths),
+                "prefixes_done": 0, "offsets": [0] * len(outputs)}
+    if resume:
+        with open(manifest_file, "r") as f:
+            saved = json.load(f)
+        if saved["job"] != manifest["job"]:
+            raise ValueError(f"{manifest_file} was written for a different job: {saved['job']}")
+        manifest = saved
+
+    tasks = ((task_length(prefix, length, depth), min_length, layout, constraints, prefix, split_lengths)
+             for prefix in prefixes[manifest["prefixes_done"]:])
+    parts_dir = output_file + ".parts"
+    pool = None
+    files = []
+    try:
+        # On resume drop anything written after the last manifest update, then continue appending
+        for (_, file_name), offset in zip(outputs, manifest["offsets"]):
+            file = open(file_name, "ab" if resume else "wb")
+            file.truncate(offset)
+            files.append(file)
+        file_by_key = {key: file for (key, _), file in zip(outputs, files)}
+        last_save = time.monotonic()
+        if workers > 1:
+            # Workers write each prefix to its own part files, which are copied over in prefix order
+            os.makedirs(parts_dir, exist_ok=True)
+            pool = multiprocessing.Pool(workers)
+            first = manifest["prefixes_done"]
+            part_tasks = (task + (os.path.join(parts_dir, str(first + number)),) for number, task in enumerate(tasks))
+            for part_files in pool.imap(render_prefix, part_tasks):
+                for key, part_file in part_files.items():
+                    with open(part_file, "rb") as part:
+                        shutil.copyfileobj(part, file_by_key[key])
+                    os.remove(part_file)
+                last_save = prefix_done(manifest_file, manifest, files, last_save)
+        else:
+            for task in tasks:
+                for key, chunk in task_walk_chunks(task):
+                    file_by_key[key].write(chunk)
+                last_save = prefix_done(manifest_file, manifest, files, last_save)
+    finally:
+        for file in files:
+            file.close()
+        if pool:
+            pool.terminate()
+            pool.join()
+        if os.path.isdir(parts_dir):
+            shutil.rmtree(parts_dir)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+def count_walks_by_length(length, layout, constraints=None, min_length=None):
+    """
+    Counts the walks of every length from min_length (default: length) to length and their exact output size
+    in bytes (including newlines) without generating them, as {length: (walks, size)}. All lengths come out of
+    one pass of repeatedly multiplying the per-key walk counts with the adjacency matrix.
+    """
+    min_length = max(min_length or length, 1)
+    if length < min_length:
+        return {}
+    if is_constrained(constraints):
+        return count_prefix_walks(length, layout, constraints, walk_prefixes(layout, constraints, 0), min_length)
+    keys, adjacency, starts = compile_layout(KEYBOARD_LAYOUTS[layout])
+    key_bytes = [len(key.encode('utf-8')) for key in keys]
+
+    # counts[i] and lengths[i] are the number and total length of walks so far ending on keys[i]
+    counts = [0] * len(keys)
+    for start in starts:
+        counts[start] += 1
+    lengths = [count * size for count, size in zip(counts, key_bytes)]
+    totals = {}
+    for walk_length in range(1, length + 1):
+        if walk_length > 1:
+            new_counts = [0] * len(keys)
+            new_lengths = [0] * len(keys)
+            for node, adj_list in enumerate(adjacency):
+                for adj in adj_list:
+                    new_counts[adj] += counts[node]
+                    new_lengths[adj] += lengths[node] + counts[node] * key_bytes[adj]
+            counts, lengths = new_counts, new_lengths
+        if walk_length >= min_length:
+            total_walks = sum(counts)
+            totals[walk_length] = (total_walks, sum(lengths) + total_walks)
+    return totals
+
+def count_walks(length, layout, constraints=None):
+    """
+    Counts the walks of a specified length and their exact output size in bytes (including newlines)
+    without generating them.
+    """
+    return count_walks_by_length(length, layout, constraints).get(length, (0, 0))
 
 def main():
     parser = argparse.ArgumentParser(description="Generate keyboard walks.")
-    parser.add_argument("-l", "--length", type=int, help="Length of the walks", required=True)
+    parser.add_argument("-l", "--length", "--max-length", type=int, help="Length of the walks (the longest length with --min-length)", required=True)
+    parser.add_argument("--min-length", type=int, help="Also generate every shorter walk down to this length in the same pass")
+    parser.add_argument("--split-lengths", action="store_true", help="With --min-length, write each length to its own file (e.g. walks.8.txt) instead of one file")
     parser.add_argument("-o", "--output", type=str, help="Output file name", required=True)
     parser.add_argument("-k", "--layout", type=str, choices=["qwerty", "qwertyshifted", "qwertyshifted1", "qwertyshifted2", "dvorak", "azerty"], default="qwerty", help="Keyboard layout")
+    parser.add_argument("--max-turns", type=int, help="Maximum number of direction changes in a walk")
+    parser.add_argument("--no-revisit", action="store_true", help="Never use the same key twice in a walk (e.g. no 'qwqwqw')")
+    parser.add_argument("--min-run", type=int, help="Minimum number of steps in the same direction before the walk may turn (the final run included)")
+    parser.add_argument("--directions", type=parse_directions, help="Comma separated allowed step directions: left, right, up, down, up-left, up-right, down-left, down-right, or the groups horizontal, vertical, diagonal")
+    parser.add_argument("--shift-switches", type=int, help="Allow walks on the shift layer, switching between layers at most this many times (qwerty only)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes. Default: all cores.")
+    parser.add_argument("--shard", type=parse_shard, help="Only generate shard i of k (e.g. 2/4) so a run can be split across machines.")
+    parser.add_argument("--prefix-depth", type=int, help=f"Steps in the walk prefixes handed out as tasks. Default: length - {TASK_WALK_STEPS + 1} (at least 1, shallower when that gives more than {MAX_TASKS} prefixes), deeper when there are fewer than {TASKS_PER_WORKER} prefixes per worker (counted as one worker with --shard, so every machine splits the same prefixes). Walks shorter than the prefixes form one task of their own.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from <output>.manifest.")
+    parser.add_argument("--skip-count", action="store_true", help="Start generating without counting the walks first (counting constrained walks, --no-revisit above all, can take long).")
+    add_plan_arguments(parser)
 
     args = parser.parse_args()
 
-    walks = keyboard_walks(args.length, args.layout)
-    total_walks = len(walks)
+    if args.shift_switches is not None and args.layout not in SHIFT_LAYERS:
+        parser.error(f"--shift-switches is only available for: {', '.join(SHIFT_LAYERS)}")
+    if args.min_length is not None and not 1 <= args.min_length <= args.length:
+        parser.error("--min-length must be between 1 and the length")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.prefix_depth is not None and args.prefix_depth < 0:
+        parser.error("--prefix-depth must not be negative")
+    if args.skip_count and args.plan:
+        parser.error("--plan needs the walk count, so it cannot be combined with --skip-count")
+    if args.resume and not os.path.exists(args.output + ".manifest"):
+        parser.error(f"--resume needs the manifest {args.output}.manifest")
+    constraints = WalkConstraints(args.max_turns, args.no_revisit, args.min_run, args.directions, args.shift_switches)
+    if args.prefix_depth is not None:
+        depth = min(args.prefix_depth, args.length - 1)
+    elif args.resume:
+        # The default depth may depend on the worker count, so keep the one the interrupted run used
+        with open(args.output + ".manifest", "r") as f:
+            depth = json.load(f)["job"]["prefix_depth"]
+    else:
+        depth = job_prefix_depth(args.length, args.layout, args.workers, args.shard)
+    if args.shard:
+        print(f"Shard {args.shard[0]}/{args.shard[1]} of the prefixes at depth {depth}")
+
+    min_length = args.min_length or args.length
+
+    if args.skip_count:
+        print("Total walks to be generated: unknown (counting skipped)")
+    else:
+        if args.shard or is_constrained(constraints):
+            prefixes = shard_prefixes(min_length, args.layout, constraints, depth, args.shard)
+            totals = count_job_walks(args.length, args.layout, constraints, prefixes, depth, min_length, args.workers)
+        else:
+            totals = count_walks_by_length(args.length, args.layout, constraints, min_length)
+        total_walks = sum(count for count, _ in totals.values())
+        total_size = sum(size for _, size in totals.values())
+        if len(totals) > 1:
+            for walk_length, (count, size) in totals.items():
+                print(f"Length {walk_length}: {count} walks ({format_file_size(size)})")
+
+        if args.plan:
+            print_plan(total_walks, total_size, args.output, args.throughput)
+            return
 
-    print(f"Total walks to be generated: {total_walks}")
+        print(f"Total walks to be generated: {total_walks}")
     confirm = input("Do you want to proceed with generation? (yes/no): ")
     if confirm.lower() == 'yes':
-        with open(args.output, 'w') as file:
-            for walk in walks:
-                file.write(walk + '\n')
-        print(f"Walks written to {args.output}")
+        try:
+            write_walks(args.length, args.layout, args.output, constraints, args.workers, depth, args.shard, args.resume,
+                        min_length, args.split_lengths)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if args.split_lengths:
+            print(f"Walks written to {length_output_file(args.output, min_length)} ... {length_output_file(args.output, args.length)}")
+        else:
+            print(f"Walks written to {args.output}")
     else:
         print("Generation cancelled.")
 
@@ -0,0 +1,67 @@
+import os
+import shutil
+
+# Assumed generation + write speed used for the ETA, in MB per second
+DEFAULT_THROUGHPUT = 50
+
+def format_file_size(size_bytes):
+    """
+    Formats file size in appropriate units: KB, MB, GB, or TB.
+    """
+    if size_bytes >= 1024 ** 4:
+        return f"{size_bytes / (1024 ** 4):.2f} TB"
+    elif size_bytes >= 1024 ** 3:
+        return f"{size_bytes / (1024 ** 3):.2f} GB"
+    elif size_bytes >= 1024 ** 2:
+        return f"{size_bytes / (1024 ** 2):.2f} MB"
+    elif size_bytes >= 1024:
+        return f"{size_bytes / 1024:.2f} KB"
+    else:
+        return f"{size_bytes} Bytes"
+
+def format_duration(seconds):
+    """
+    Formats a duration in seconds as e.g. '2d 3h 4m 5s'.
+    """
+    seconds = int(round(seconds))
+    parts = []
+    for unit, unit_seconds in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= unit_seconds:
+            parts.append(f"{seconds // unit_seconds}{unit}")
+            seconds %= unit_seconds
+    parts.append(f"{seconds}s")
+    return ' '.join(parts)
+
+def product_keyspace(position_lengths):
+    """
+    Counts the candidates of a Cartesian product and their total length (excluding newlines) without generating them.
+    position_lengths holds, for every position, the byte length of each of its choices.
+    """
+    count, length = 1, 0
+    for lengths in position_lengths:
+        length = length * len(lengths) + count * sum(lengths)
+        count *= len(lengths)
+    return count, length
+
+def add_plan_arguments(parser):
+    """
+    Adds the shared --plan and --throughput options to a generator's argument parser.
+    """
+    parser.add_argument("--plan", action="store_true", help="Dry run: print the exact number of candidates, output size, disk space check and ETA, then exit.")
+    parser.add_argument("--throughput", type=float, default=DEFAULT_THROUGHPUT, help=f"Generation speed in MB/s used for the --plan ETA. Default: {DEFAULT_THROUGHPUT}.")
+
+def print_plan(candidates, size_bytes, output_file=None, throughput=DEFAULT_THROUGHPUT, exact_size=True):
+    """
+    Prints the dry run summary: candidate count, output size, free disk space and ETA.
+    """
+    print(f"Total candidates: {candidates}")
+    print(f"Output size: {'' if exact_size else '~'}{format_file_size(size_bytes)} ({size_bytes} bytes)")
+    if output_file:
+        directory = os.path.dirname(os.path.abspath(output_file))
+        free_bytes = shutil.disk_usage(directory).free
+        if free_bytes >= size_bytes:
+            print(f"Free disk space: {format_file_size(free_bytes)} (enough)")
+        else:
+            print(f"Free disk space: {format_file_size(free_bytes)} (NOT enough, {format_file_size(size_bytes - free_bytes)} short)")
+    if throughput > 0:
+        print(f"ETA at {throughput:g} MB/s: {format_duration(size_bytes / (throughput * 1024 ** 2))}")
@@ -1,33 +1,93 @@
 import itertools
 import sys
+import os
+import json
 import argparse
+import multiprocessing
+import heapq
+import math
+from collections import Counter
 
-def predict_permutations(string, leetspeak_dict):
-    """
-    Predicts the total number of leetspeak permutations for a given string.
-    """
-    total_permutations = 1
-    for char in string:
-        if char in leetspeak_dict:
-            total_permutations *= len(leetspeak_dict[char])
-        else:
-            total_permutations *= 1
-    return total_permutations
+from keyspace_planner import add_plan_arguments, format_file_size, print_plan, product_keyspace
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Leetspeak substitutions for each character. Characters not listed are kept as they are.
+LEETSPEAK_DICT = {
+    'a': ['4', '@', 'A', 'a'],
+    'b': ['8', 'B', 'b'],
+    'c': ['(', 'C', 'c'],
+    'd': ['D', 'd', '|)', '|]'],
+    'e': ['3', 'E', 'e'],
+    'f': ['F', 'f'],
+    'g': ['6', 'G', 'g'],
+    'h': ['#', 'H', 'h'],
+    'i': ['1', '!', 'I', 'i'],
+    'j': ['J', 'j'],
+    'k': ['K', 'k'],
+    'l': ['1', 'L', 'l'],
+    'm': ['M', 'm'],
+    'n': ['N', 'n'],
+    'o': ['0', 'O', 'o'],
+    'p': ['P', 'p'],
+    'q': ['Q', 'q'],
+    'r': ['R', 'r'],
+    's': ['5', '$', 'S', 's'],
+    't': ['7', 'T', 't'],
+    'u': ['U', 'u', '|_|'],
+    'v': ['V', 'v'],
+    'w': ['W', 'w'],
+    'x': ['X', 'x'],
+    'y': ['Y', 'y'],
+    'z': ['Z', 'z'],
+    ' ': ['-', '_', ' '],
+}
+
+# How many candidates are generated and written per block (the checkpoint is updated after every block)
+BLOCK_SIZE = 65536
 
-def format_file_size(size_bytes):
+# How many candidates a worker generates per task in wordlist mode
+CHUNK_SIZE = 16 * BLOCK_SIZE
+
+# hashcat supports up to four custom charsets (?1 to ?4) per mask
+HASHCAT_CUSTOM_CHARSETS = 4
+
+# Per worker state for wordlist mode, set once by init_worker
+_worker_dict = None
+_worker_engine = None
+
+def predict_permutations(string, leetspeak_dict, max_subs=None, top=None):
     """
-    Formats file size in appropriate units: KB, MB, GB, or TB.
+    Predicts the total number of leetspeak permutations for a given string.
+    With max_subs only candidates with at most that many substituted characters are counted,
+    and top caps the result at that many candidates.
     """
-    if size_bytes >= 1024 ** 4:
-        return f"{size_bytes / (1024 ** 4):.2f} TB"
-    elif size_bytes >= 1024 ** 3:
-        return f"{size_bytes / (1024 ** 3):.2f} GB"
-    elif size_bytes >= 1024 ** 2:
-        return f"{size_bytes / (1024 ** 2):.2f} MB"
-    elif size_bytes >= 1024:
-        return f"{size_bytes / 1024:.2f} KB"
+    if max_subs is None:
+        total_permutations = 1
+        for char in string:
+            if char in leetspeak_dict:
+                total_permutations *= len(leetspeak_dict[char])
+            else:
+                total_permutations *= 1
     else:
-        return f"{size_bytes} Bytes"
+        # counts[k] is the number of prefixes with exactly k substituted characters
+        counts = [1]
+        for char in string:
+            options = leetspeak_dict.get(char, [char])
+            keep = 1 if char in options else 0
+            substitutes = len(options) - keep
+            new_counts = [0] * (len(counts) + 1)
+            for subs, count in enumerate(counts):
+                new_counts[subs] += count * keep
+                new_counts[subs + 1] += count * substitutes
+            counts = new_counts[:max_subs + 1]
+        total_permutations = sum(counts)
+    if top is not None:
+        total_permutations = min(total_permutations, top)
+    return total_permutations
 
 def estimate_file_size(total_permutations, avg_length):
     """
@@ -35,67 +95,619 @@ def estimate_file_size(total_permutations, avg_length):
     """
     return total_permutations * (avg_length + 1)  # Include newline character
 
-def generate_leetspeak_combinations(word, leetspeak_dict):
+def build_choices(word, leetspeak_dict):
+    """
+    Returns the list of possible substitutions for every character of the word.
+    """
+    return [leetspeak_dict[char] if char in leetspeak_dict else [char] for char in word]
+
+def unrank_combination(index, choices):
+    """
+    Converts a candidate index into per-character choice indexes (mixed radix, last character
+    changing fastest), matching the order itertools.product produces.
+    """
+    digits = [0] * len(choices)
+    for pos in range(len(choices) - 1, -1, -1):
+        index, digits[pos] = divmod(index, len(choices[pos]))
+    return digits
+
+def rank_combination(digits, choices):
+    """
+    Converts per-character choice indexes back into the candidate index.
+    """
+    index = 0
+    for digit, options in zip(digits, choices):
+        index = index * len(options) + digit
+    return index
+
+def predict_size(string, leetspeak_dict, max_subs=None):
+    """
+    Predicts the exact output size in bytes (including newlines) for a given string.
+    Unlike estimate_file_size this accounts for multi-character substitutions such as '|_|'.
+    With max_subs only candidates with at most that many substituted characters are counted.
+    """
+    choices = build_choices(string, leetspeak_dict)
+    if max_subs is None:
+        count, length = product_keyspace([[len(option.encode('utf-8')) for option in options] for options in choices])
+        return length + count
+    # counts[k] and lengths[k] are the number and total length of prefixes with exactly k substituted characters
+    counts, lengths = [1], [0]
+    for char, options in zip(string, choices):
+        new_counts = [0] * (len(counts) + 1)
+        new_lengths = [0] * (len(counts) + 1)
+        for subs, (count, length) in enumerate(zip(counts, lengths)):
+            for option in options:
+                k = subs + (option != char)
+                new_counts[k] += count
+                new_lengths[k] += length + count * len(option.encode('utf-8'))
+        counts, lengths = new_counts[:max_subs + 1], new_lengths[:max_subs + 1]
+    return sum(counts) + sum(lengths)
+
+def predict_size_before(string, leetspeak_dict, index):
+    """
+    Predicts the exact number of bytes written for the candidates with an index below index.
+    """
+    choices = build_choices(string, leetspeak_dict)
+    lengths = [[len(option.encode('utf-8')) for option in options] for options in choices]
+    total_count, total_length = product_keyspace(lengths)
+    if index >= total_count:
+        return total_count + total_length
+    # suffixes[p] is the (count, total length) of all combinations of the characters from p onwards
+    suffixes = [(1, 0)] * (len(lengths) + 1)
+    for pos in range(len(lengths) - 1, -1, -1):
+        count, length = suffixes[pos + 1]
+        suffixes[pos] = (count * len(lengths[pos]), sum(lengths[pos]) * count + len(lengths[pos]) * length)
+    size = 0
+    prefix_length = 0
+    for pos, digit in enumerate(unrank_combination(index, choices)):
+        after_count, after_length = suffixes[pos + 1]
+        # Every candidate that shares the prefix so far but has a smaller choice at this position comes first
+        size += digit * after_count * prefix_length + sum(lengths[pos][:digit]) * after_count + digit * after_length
+        prefix_length += lengths[pos][digit]
+    return size + index  # Include newline characters
+
+def generate_leetspeak_combinations(word, leetspeak_dict, start=0, stop=None):
     """
     Generates leetspeak combinations lazily to reduce memory usage.
+    Only candidates with an index in [start, stop) are produced; the first one is found by
+    unranking, so jumping into the middle of the keyspace costs O(len(word)).
     """
-    word_variations = (
-        leetspeak_dict[char] if char in leetspeak_dict else [char]
-        for char in word
-    )
-    for combo in itertools.product(*word_variations):
-        yield ''.join(combo)
+    choices = build_choices(word, leetspeak_dict)
+    total_permutations = predict_permutations(word, leetspeak_dict)
+    if stop is None or stop > total_permutations:
+        stop = total_permutations
+    if start >= stop:
+        return
+
+    if start == 0 and stop == total_permutations:
+        for combo in itertools.product(*choices):
+            yield ''.join(combo)
+        return
+
+    # Odometer walk from the unranked starting point
+    digits = unrank_combination(start, choices)
+    current = [options[digit] for options, digit in zip(choices, digits)]
+    for _ in range(stop - start):
+        yield ''.join(current)
+        pos = len(digits) - 1
+        while pos >= 0:
+            digits[pos] += 1
+            if digits[pos] < len(choices[pos]):
+                current[pos] = choices[pos][digits[pos]]
+                break
+            digits[pos] = 0
+            current[pos] = choices[pos][0]
+            pos -= 1
+
+def default_weight(char, substitution):
+    """
+    Weight used for substitutions without a configured or learned weight: keeping the
+    character is most likely, then its uppercase form, then the leetspeak symbols.
+    """
+    if substitution == char:
+        return 8.0
+    if substitution == char.upper():
+        return 2.0
+    return 1.0
+
+def load_weights(weights_file):
+    """
+    Loads substitution weights from a JSON file of the form {"a": {"4": 10, "@": 2, "a": 50}}.
+    Substitutions that are not listed use default_weight.
+    """
+    with open(weights_file, 'r', encoding='utf-8') as f:
+        weights = json.load(f)
+    for char, substitutions in weights.items():
+        for substitution, weight in substitutions.items():
+            if not isinstance(weight, (int, float)) or weight <= 0:
+                raise ValueError(f"Weight for '{char}' -> '{substitution}' must be a positive number")
+    return weights
+
+def learn_weights(pot_file, leetspeak_dict):
+    """
+    Learns substitution weights from the plaintexts of a cracked pot file (hash:plaintext per line).
+    Every substitution is weighted by how often it appears in the plaintexts, plus one so that
+    unseen substitutions are still generated.
+    """
+    char_counts = Counter()
+    multi_char = {sub for options in leetspeak_dict.values() for sub in options if len(sub) > 1}
+    multi_char_counts = Counter()
+    with open(pot_file, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            parts = line.rstrip('\n').split(':', 1)
+            if len(parts) == 2:
+                plaintext = parts[1]
+                char_counts.update(plaintext)
+                for sub in multi_char:
+                    if sub in plaintext:
+                        multi_char_counts[sub] += plaintext.count(sub)
+    weights = {}
+    for char, options in leetspeak_dict.items():
+        weights[char] = {
+            sub: (multi_char_counts[sub] if len(sub) > 1 else char_counts[sub]) + 1
+            for sub in options
+        }
+    return weights
+
+def build_weighted_choices(word, leetspeak_dict, weights=None):
+    """
+    Returns, for every character, its (log probability, substitution) pairs sorted from most to least likely.
+    """
+    weights = weights or {}
+    weighted_choices = []
+    for char in word:
+        options = leetspeak_dict.get(char, [char])
+        char_weights = [weights.get(char, {}).get(sub, default_weight(char, sub)) for sub in options]
+        total_weight = sum(char_weights)
+        pairs = [(math.log(weight / total_weight), sub) for weight, sub in zip(char_weights, options)]
+        weighted_choices.append(sorted(pairs, key=lambda pair: -pair[0]))
+    return weighted_choices
+
+def generate_likely_combinations(word, leetspeak_dict, weights=None, max_subs=None, top=None):
+    """
+    Generates leetspeak combinations in descending probability using a best-first search over the
+    per-character choices. Every candidate is reached from exactly one parent by bumping one
+    character to its next most likely substitution, and only characters at or after the last
+    bumped one may be bumped, so no candidate is produced twice and the heap stays small.
+    With max_subs, branches that cannot get back under the cap are cut early.
+    """
+    choices = build_weighted_choices(word, leetspeak_dict, weights)
+    length = len(choices)
+    is_sub = [[sub != char for _, sub in options] for char, options in zip(word, choices)]
+    keep_index = [row.index(False) if False in row else None for row in is_sub]
+    # forced_subs[j] is the number of characters from j onwards that have no way to stay unchanged
+    forced_subs = [0] * (length + 1)
+    for pos in range(length - 1, -1, -1):
+        forced_subs[pos] = forced_subs[pos + 1] + (keep_index[pos] is None)
+
+    def fewest_subs(digits, last):
+        # Smallest number of substitutions any descendant of this candidate can have
+        subs = sum(is_sub[pos][digits[pos]] for pos in range(last))
+        if last < length:
+            subs += 0 if keep_index[last] is not None and keep_index[last] >= digits[last] else 1
+            subs += forced_subs[last + 1]
+        return subs
+
+    root = (0,) * length
+    if max_subs is not None and fewest_subs(root, 0) > max_subs:
+        return
+    heap = [(-sum(options[0][0] for options in choices), 0, root, 0)]
+    pushed = 1
+    emitted = 0
+    while heap and (top is None or emitted < top):
+        neg_score, _, digits, last = heapq.heappop(heap)
+        if max_subs is None or sum(is_sub[pos][digit] for pos, digit in enumerate(digits)) <= max_subs:
+            yield ''.join(choices[pos][digit][1] for pos, digit in enumerate(digits))
+            emitted += 1
+        for pos in range(last, length):
+            digit = digits[pos] + 1
+            if digit == len(choices[pos]):
+                continue
+            child = digits[:pos] + (digit,) + digits[pos + 1:]
+            if max_subs is not None and fewest_subs(child, pos) > max_subs:
+                continue
+            child_score = neg_score + choices[pos][digit - 1][0] - choices[pos][digit][0]
+            heapq.heappush(heap, (child_score, pushed, child, pos))
+            pushed += 1
+
+def encode_blocks(combos, block_size=BLOCK_SIZE):
+    """
+    Groups candidate strings into (count, bytes) blocks of newline terminated candidates.
+    """
+    while True:
+        block = list(itertools.islice(combos, block_size))
+        if not block:
+            return
+        yield len(block), ('\n'.join(block) + '\n').encode('utf-8')
+
+def generate_leetspeak_blocks(word, leetspeak_dict, start=0, stop=None, block_size=BLOCK_SIZE):
+    """
+    Generates the combinations in [start, stop) as (count, bytes) blocks of newline terminated candidates.
+    """
+    return encode_blocks(generate_leetspeak_combinations(word, leetspeak_dict, start, stop), block_size)
+
+def build_byte_tables(word, leetspeak_dict):
+    """
+    Builds a uint8 table of the encoded substitutions for every character of the word.
+    Substitutions shorter than the longest one for that character (e.g. 'd' next to '|)') are padded with NUL bytes.
+    """
+    tables = []
+    for options in build_choices(word, leetspeak_dict):
+        encoded = [option.encode('utf-8') for option in options]
+        table = np.zeros((len(encoded), max(len(option) for option in encoded)), dtype=np.uint8)
+        for row, option in enumerate(encoded):
+            table[row, :len(option)] = np.frombuffer(option, dtype=np.uint8)
+        tables.append(table)
+    return tables
+
+def generate_leetspeak_blocks_numpy(word, leetspeak_dict, start=0, stop=None, block_size=BLOCK_SIZE):
+    """
+    Vectorised version of generate_leetspeak_blocks. Each block of candidate indexes is split into
+    mixed radix digits, gathered from the per-character byte tables into one fixed width matrix and
+    written out as a single buffer. Produces exactly the same bytes as the pure Python engine.
+    """
+    total_permutations = predict_permutations(word, leetspeak_dict)
+    if stop is None or stop > total_permutations:
+        stop = total_permutations
+    tables = build_byte_tables(word, leetspeak_dict)
+    width = sum(table.shape[1] for table in tables) + 1  # Include newline character
+    padded = any((table == 0).any() for table in tables)
+
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        remaining = np.arange(block_start, block_stop, dtype=np.int64)
+        matrix = np.empty((block_stop - block_start, width), dtype=np.uint8)
+        matrix[:, -1] = ord('\n')
+        column = width - 1
+        for table in reversed(tables):
+            column -= table.shape[1]
+            remaining, digits = np.divmod(remaining, table.shape[0])
+            matrix[:, column:column + table.shape[1]] = table[digits]
+        # Dropping the padding bytes turns the fixed width rows back into variable length lines
+        data = matrix[matrix != 0] if padded else matrix
+        yield block_stop - block_start, data.tobytes()
+
+def select_block_generator(engine, stop):
+    """
+    Returns the block generator for the engine. Keyspaces beyond NumPy's int64 indexes always use python.
+    """
+    if engine == 'numpy' and np is not None and stop <= np.iinfo(np.int64).max:
+        return generate_leetspeak_blocks_numpy
+    return generate_leetspeak_blocks
+
+def init_worker(leetspeak_dict, engine):
+    """
+    Stores the substitution table and engine once per worker process instead of sending them with every task.
+    """
+    global _worker_dict, _worker_engine
+    _worker_dict = leetspeak_dict
+    _worker_engine = engine
+
+def expand_word_chunk(task):
+    """
+    Worker task: generates candidates [start, stop) of one word and returns them as a single byte chunk.
+    """
+    word, start, stop = task
+    generate_blocks = select_block_generator(_worker_engine, stop)
+    return b''.join(block for count, block in generate_blocks(word, _worker_dict, start, stop))
+
+def read_wordlist(wordlist_file):
+    """
+    Streams the non-empty words of a wordlist file.
+    """
+    with open(wordlist_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            word = line.strip()
+            if word:
+                yield word
+
+def wordlist_tasks(wordlist_file, leetspeak_dict, chunk_size=CHUNK_SIZE):
+    """
+    Splits every word of the wordlist into (word, start, stop) tasks of at most chunk_size candidates, in order.
+    """
+    for word in read_wordlist(wordlist_file):
+        total_permutations = predict_permutations(word, leetspeak_dict)
+        for start in range(0, total_permutations, chunk_size):
+            yield word, start, min(start + chunk_size, total_permutations)
+
+def process_wordlist(wordlist_file, output_file, leetspeak_dict, engine, workers, plan=False, throughput=None):
+    """
+    Expands every word of the wordlist on a process pool. Results are collected in task order,
+    so the output is the same as running the words one after another.
+    With plan only the totals are printed.
+    """
+    total_words = 0
+    total_permutations = 0
+    estimated_size = 0
+    for word in read_wordlist(wordlist_file):
+        permutations = predict_permutations(word, leetspeak_dict)
+        total_words += 1
+        total_permutations += permutations
+        estimated_size += predict_size(word, leetspeak_dict)
+    print(f"Total words: {total_words}")
+    if plan:
+        print_plan(total_permutations, estimated_size, output_file, throughput)
+        return
+    print(f"Total permutations: {total_permutations}")
+    print(f"Estimated file size: ~{format_file_size(estimated_size)}")
+    sys.stdout.flush()
+
+    out = open(output_file, 'wb') if output_file else sys.stdout.buffer
+    try:
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(leetspeak_dict, engine)) as pool:
+            for chunk in pool.imap(expand_word_chunk, wordlist_tasks(wordlist_file, leetspeak_dict)):
+                out.write(chunk)
+    finally:
+        if output_file:
+            out.close()
+        else:
+            out.flush()
+    if output_file:
+        print(f"Permutations written to {output_file}")
+
+def escape_hcmask(text):
+    """
+    Escapes literal text for a .hcmask line: '?' is doubled and ',' is backslash escaped.
+    """
+    return text.replace('?', '??').replace(',', '\\,')
+
+def build_mask_pieces(word, leetspeak_dict):
+    """
+    Returns, for every character, the mask pieces covering its substitutions. Single byte
+    substitutions are merged into one charset piece (a sorted string); multi-character ones
+    such as '|)' or '|_|' become literal pieces, each of which is a separate mask branch.
+    """
+    all_pieces = []
+    for options in build_choices(word, leetspeak_dict):
+        singles = [option for option in options if len(option.encode('utf-8')) == 1]
+        pieces = [('literal', option) for option in options if len(option.encode('utf-8')) != 1]
+        if len(singles) > 1:
+            pieces.insert(0, ('charset', ''.join(sorted(set(singles)))))
+        elif singles:
+            pieces.insert(0, ('literal', singles[0]))
+        all_pieces.append(pieces)
+    return all_pieces
+
+def generate_hashcat_masks(word, leetspeak_dict):
+    """
+    Converts the leetspeak expansion of the word into .hcmask lines, yielding (line, candidates, size)
+    where size is the number of wordlist bytes the line replaces.
+    Every branch keeps the (up to four) charsets that cover the most candidates as custom charsets;
+    positions using any other charset are expanded into literals, which gives the fewest lines.
+    """
+    for branch in itertools.product(*build_mask_pieces(word, leetspeak_dict)):
+        positions = Counter(value for kind, value in branch if kind == 'charset')
+        ranked = sorted(positions, key=lambda charset: (-len(charset) ** positions[charset], charset))
+        kept = set(ranked[:HASHCAT_CUSTOM_CHARSETS])
+        expansions = [
+            [('literal', char) for char in value] if kind == 'charset' and value not in kept else [(kind, value)]
+            for kind, value in branch
+        ]
+        for expanded in itertools.product(*expansions):
+            charsets = []
+            mask = []
+            candidates = 1
+            length = 0
+            for kind, value in expanded:
+                if kind == 'charset':
+                    if value not in charsets:
+                        charsets.append(value)
+                    mask.append(f"?{charsets.index(value) + 1}")
+                    candidates *= len(value)
+                    length += 1
+                else:
+                    mask.append(escape_hcmask(value))
+                    length += len(value.encode('utf-8'))
+            line = ','.join([escape_hcmask(charset) for charset in charsets] + [''.join(mask)])
+            yield line, candidates, estimate_file_size(candidates, length)
+
+def parse_shard(shard, total_permutations):
+    """
+    Converts a shard specification 'i/k' (1-based) into the [start, stop) index range of that shard.
+    """
+    try:
+        part, parts = (int(value) for value in shard.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected i/k (e.g. 1/4)")
+    if parts < 1 or not 1 <= part <= parts:
+        raise ValueError(f"Invalid shard '{shard}', i must be between 1 and k")
+    return total_permutations * (part - 1) // parts, total_permutations * part // parts
+
+def load_checkpoint(checkpoint_file):
+    """
+    Loads a checkpoint written by save_checkpoint.
+    """
+    with open(checkpoint_file, 'r') as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint_file, state):
+    """
+    Atomically writes the checkpoint state so a crash never leaves a half written file.
+    """
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, checkpoint_file)
+
+def validate_checkpoint(checkpoint, total_permutations):
+    """
+    Checks that a checkpoint's range fits the keyspace of its input, raising ValueError otherwise.
+    """
+    range_start, stop, last_index, offset = (checkpoint.get(key) for key in ('start', 'stop', 'last_index', 'offset'))
+    if not all(isinstance(value, int) for value in (range_start, stop, offset)) or offset < 0:
+        raise ValueError("it is missing its range or output offset")
+    if not 0 <= range_start <= stop <= total_permutations:
+        raise ValueError(f"its range {range_start}-{stop} does not fit the keyspace of '{checkpoint['input']}' (0-{total_permutations})")
+    if last_index is not None and (not isinstance(last_index, int) or not range_start <= last_index < stop):
+        raise ValueError(f"its last index {last_index} is outside its range {range_start}-{stop}")
+
+def emit_masks(input_string, output_file, leetspeak_dict):
+    """
+    Writes the .hcmask lines for the input string and reports how much wordlist they replace.
+    """
+    mask_lines = 0
+    total_candidates = 0
+    replaced_size = 0
+    mask_size = 0
+    out = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+    try:
+        for line, candidates, size in generate_hashcat_masks(input_string, leetspeak_dict):
+            out.write(line + '\n')
+            mask_lines += 1
+            total_candidates += candidates
+            replaced_size += size
+            mask_size += len(line.encode('utf-8')) + 1
+    finally:
+        if output_file:
+            out.close()
+    print(f"Mask lines: {mask_lines}")
+    print(f"Total permutations covered: {total_candidates}")
+    print(f"Wordlist size replaced: ~{format_file_size(replaced_size)} (mask file: {format_file_size(mask_size)})")
+    if output_file:
+        print(f"Masks written to {output_file}")
 
 def main():
     parser = argparse.ArgumentParser(description="A leetspeak generator that takes an input string and generates all possible leetspeak variations.")
     parser.add_argument('-i', '--input', type=str, help="Input string containing up to three words, separated by spaces. For multiple words, wrap in quotes.")
+    parser.add_argument('-f', '--file', type=str, help="Wordlist file with one input string per line. Words are expanded in parallel.")
     parser.add_argument('-o', '--output', type=str, help="Output file name. If not specified, output will be printed to the screen.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes for wordlist mode. Default: number of CPUs.")
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python', help="Generation engine. The numpy engine is much faster for large outputs and falls back to python if NumPy is not installed.")
+    parser.add_argument('--skip', type=int, default=0, help="Skip the first N candidates (relative to the shard if --shard is given).")
+    parser.add_argument('--limit', type=int, help="Generate at most M candidates.")
+    parser.add_argument('--shard', type=str, help="Only generate shard i of k equal parts of the keyspace, e.g. 2/4.")
+    parser.add_argument('--checkpoint', type=str, help="Checkpoint file recording the last index written. Default: <output>.checkpoint")
+    parser.add_argument('--resume', action='store_true', help="Resume an interrupted run from its checkpoint file. Requires -o.")
+    parser.add_argument('--emit', choices=['words', 'masks'], default='words', help="Output candidate words, or hashcat .hcmask lines (with up to 4 custom charsets) that let hashcat expand them on the device.")
+    parser.add_argument('--top', type=int, help="Only generate the N most likely candidates, most likely first.")
+    parser.add_argument('--max-subs', type=int, help="Only generate candidates with at most K substituted characters, most likely first.")
+    parser.add_argument('--weights', type=str, help="JSON file of substitution weights, e.g. {\"a\": {\"4\": 10, \"a\": 50}}. Candidates are generated most likely first.")
+    parser.add_argument('--learn-weights', type=str, help="Learn substitution weights from the plaintexts of a cracked pot file. Candidates are generated most likely first.")
+    add_plan_arguments(parser)
     args = parser.parse_args()
 
-    leetspeak_dict = {
-        'a': ['4', '@', 'A', 'a'],
-        'b': ['8', 'B', 'b'],
-        'c': ['(', 'C', 'c'],
-        'd': ['D', 'd', '|)', '|]'],
-        'e': ['3', 'E', 'e'],
-        'f': ['F', 'f'],
-        'g': ['6', 'G', 'g'],
-        'h': ['#', 'H', 'h'],
-        'i': ['1', '!', 'I', 'i'],
-        'j': ['J', 'j'],
-        'k': ['K', 'k'],
-        'l': ['1', 'L', 'l'],
-        'm': ['M', 'm'],
-        'n': ['N', 'n'],
-        'o': ['0', 'O', 'o'],
-        'p': ['P', 'p'],
-        'q': ['Q', 'q'],
-        'r': ['R', 'r'],
-        's': ['5', '$', 'S', 's'],
-        't': ['7', 'T', 't'],
-        'u': ['U', 'u', '|_|'],
-        'v': ['V', 'v'],
-        'w': ['W', 'w'],
-        'x': ['X', 'x'],
-        'y': ['Y', 'y'],
-        'z': ['Z', 'z'],
-        ' ': ['-', '_', ' '],
-    }
-
-    if args.input:
+    ordered = args.top is not None or args.max_subs is not None or args.weights or args.learn_weights
+
+    if args.file and (args.input or args.skip or args.limit is not None or args.shard or args.resume or args.checkpoint):
+        parser.error("-f cannot be combined with -i, --skip, --limit, --shard, --resume or --checkpoint.")
+    if (args.resume or args.checkpoint) and not args.output:
+        parser.error("--resume and --checkpoint require an output file (-o).")
+    if args.skip < 0 or (args.limit is not None and args.limit < 0):
+        parser.error("--skip and --limit must not be negative.")
+    if ordered and (args.file or args.skip or args.limit is not None or args.shard or args.resume or args.checkpoint):
+        parser.error("--top, --max-subs and weights cannot be combined with -f, --skip, --limit, --shard, --resume or --checkpoint.")
+    if args.emit == 'masks' and (ordered or args.plan or args.file or args.skip or args.limit is not None or args.shard or args.resume or args.checkpoint):
+        parser.error("--emit masks only works on a single input string (-i or interactive).")
+    if args.weights and args.learn_weights:
+        parser.error("Use either --weights or --learn-weights, not both.")
+    if (args.top is not None and args.top < 0) or (args.max_subs is not None and args.max_subs < 0):
+        parser.error("--top and --max-subs must not be negative.")
+    checkpoint_file = None
+    if not ordered:
+        checkpoint_file = args.checkpoint or (args.output + '.checkpoint' if args.output else None)
+
+    weights = None
+    try:
+        if args.weights:
+            weights = load_weights(args.weights)
+        elif args.learn_weights:
+            weights = learn_weights(args.learn_weights, LEETSPEAK_DICT)
+    except (OSError, ValueError) as e:
+        print(f"Error loading weights: {e}")
+        sys.exit(1)
+
+    if args.engine == 'numpy' and np is None:
+        print("NumPy is not installed, falling back to the python engine.")
+        args.engine = 'python'
+
+    if args.file:
+        try:
+            process_wordlist(args.file, args.output, LEETSPEAK_DICT, args.engine, args.workers, args.plan, args.throughput)
+        except OSError as e:
+            print(f"Error processing wordlist {args.file}: {e}")
+            sys.exit(1)
+        return
+
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint = load_checkpoint(checkpoint_file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading checkpoint {checkpoint_file}: {e}")
+            sys.exit(1)
+        if args.input and args.input.strip() != checkpoint['input']:
+            print(f"Checkpoint {checkpoint_file} belongs to input '{checkpoint['input']}'.")
+            sys.exit(1)
+
+    if checkpoint:
+        input_string = checkpoint['input']
+    elif args.input:
         input_string = args.input.strip()
     else:
         input_string = input("Enter input string (up to 3 words): ").strip()
 
+    if args.emit == 'masks':
+        emit_masks(input_string, args.output, LEETSPEAK_DICT)
+        return
+
     # Calculate total permutations
-    total_permutations = predict_permutations(input_string, leetspeak_dict)
-    avg_length = len(input_string)
-    estimated_size = estimate_file_size(total_permutations, avg_length)
+    total_permutations = predict_permutations(input_string, LEETSPEAK_DICT)
+
+    # Work out the slice of the keyspace to generate
+    if ordered:
+        range_start, start = 0, 0
+        stop = predict_permutations(input_string, LEETSPEAK_DICT, args.max_subs, args.top)
+    elif checkpoint:
+        try:
+            validate_checkpoint(checkpoint, total_permutations)
+        except ValueError as e:
+            print(f"Error: checkpoint {checkpoint_file} is invalid: {e}")
+            sys.exit(1)
+        range_start, stop = checkpoint['start'], checkpoint['stop']
+        start = range_start if checkpoint['last_index'] is None else checkpoint['last_index'] + 1
+    else:
+        range_start, stop = 0, total_permutations
+        if args.shard:
+            try:
+                range_start, stop = parse_shard(args.shard, total_permutations)
+            except ValueError as e:
+                parser.error(str(e))
+        range_start = min(range_start + args.skip, stop)
+        if args.limit is not None:
+            stop = min(stop, range_start + args.limit)
+        start = range_start
+
+    selected_permutations = stop - start
+
+    if ordered:
+        combos = generate_likely_combinations(input_string, LEETSPEAK_DICT, weights, args.max_subs, args.top)
+        blocks = encode_blocks(combos)
+    else:
+        blocks = select_block_generator(args.engine, stop)(input_string, LEETSPEAK_DICT, start, stop)
+    if ordered:
+        estimated_size = predict_size(input_string, LEETSPEAK_DICT, args.max_subs)
+        capped_permutations = predict_permutations(input_string, LEETSPEAK_DICT, args.max_subs)
+        if capped_permutations != selected_permutations:
+            # --top picks candidates by probability, so scale the size of everything under the cap
+            estimated_size = estimated_size * selected_permutations // capped_permutations
+    else:
+        estimated_size = predict_size_before(input_string, LEETSPEAK_DICT, stop) - predict_size_before(input_string, LEETSPEAK_DICT, start)
     formatted_size = format_file_size(estimated_size)
 
+    if args.plan:
+        if selected_permutations != total_permutations:
+            print(f"Total permutations: {total_permutations}")
+        print_plan(selected_permutations, estimated_size, args.output, args.throughput,
+                   exact_size=not (ordered and args.top is not None))
+        return
+
     # Interactive mode: Confirm before proceeding
-    if not args.input:
+    if not args.input and not checkpoint:
         print(f"Total permutations: {total_permutations}")
+        if ordered:
+            print(f"Permutations under cap: {selected_permutations}")
+        elif selected_permutations != total_permutations:
+            print(f"Selected range: {start}-{stop} ({selected_permutations} permutations)")
         print(f"Estimated file size: ~{formatted_size}")
         proceed = input("Do you want to continue? (y/n): ").strip().lower()
         if proceed != 'y':
@@ -103,19 +715,43 @@ def main():
             sys.exit(0)
 
     # CLI mode: Print stats
-    elif args.input:
+    else:
         print(f"Total permutations: {total_permutations}")
+        if ordered:
+            print(f"Permutations under cap: {selected_permutations}")
+        elif selected_permutations != total_permutations:
+            print(f"Selected range: {start}-{stop} ({selected_permutations} permutations)")
         print(f"Estimated file size: ~{formatted_size}")
 
     # Generate and output combinations
     if args.output:
-        with open(args.output, 'w') as f:
-            for combo in generate_leetspeak_combinations(input_string, leetspeak_dict):
-                f.write(combo + '\n')
+        state = {
+            'input': input_string,
+            'start': range_start,
+            'stop': stop,
+            'last_index': checkpoint['last_index'] if checkpoint else None,
+            'offset': checkpoint['offset'] if checkpoint else 0,
+        }
+        # On resume drop anything written after the last checkpoint, then continue appending
+        with open(args.output, 'ab' if checkpoint else 'wb') as f:
+            f.truncate(state['offset'])
+            index = start
+            for count, block in blocks:
+                f.write(block)
+                if checkpoint_file:
+                    f.flush()
+                    index += count
+                    state['last_index'], state['offset'] = index - 1, f.tell()
+                    save_checkpoint(checkpoint_file, state)
+        if checkpoint_file and not args.checkpoint and os.path.exists(checkpoint_file):
+            # The default checkpoint is only needed while a run is incomplete
+            os.remove(checkpoint_file)
         print(f"Permutations written to {args.output}")
     else:
-        for combo in generate_leetspeak_combinations(input_string, leetspeak_dict):
-            print(combo)
+        sys.stdout.flush()
+        for count, block in blocks:
+            sys.stdout.buffer.write(block)
+        sys.stdout.flush()
 
 if __name__ == "__main__":
     main()
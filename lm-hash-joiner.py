@@ -1,7 +1,41 @@
 import argparse
+import heapq
+import multiprocessing
+import os
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+
+from md4 import nt_hash
+
+# Marker written in place of a hash half that is not in the POT file
+HASH_NOT_FOUND = '<HASH_NOT_FOUND>'
+
+# Size of the output write buffer in bytes
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Hashes sent to a worker at a time with --resolve-nt
+RESOLVE_CHUNK_SIZE = 16
+
+# POT entries sorted at a time while building the index; the sorted chunks are then merged
+POT_SORT_CHUNK_SIZE = 1 << 20
+
+# Cracked LM hash halves: the halves as sorted 64-bit integers (8 bytes each) and the plaintext of
+# keys[i] as plaintexts[offsets[i]:offsets[i + 1]], so millions of entries take a few compact arrays
+# instead of a dict of strings
+PotIndex = namedtuple('PotIndex', ['keys', 'offsets', 'plaintexts'])
+
+def parse_lm_half(lm_half):
+    """Convert a 16 character hex LM hash half into its 64-bit integer key, or None if it is not valid hex."""
+    if len(lm_half) != 16:
+        return None
+    try:
+        return int(lm_half, 16)
+    except ValueError:
+        return None
 
 def load_pot_file(pot_file):
-    """Load the POT file into a dictionary mapping LM hash halves to plaintexts.
+    """Load the POT file into a PotIndex of LM hash halves and their plaintexts.
 
     Expected format (each line in the file):
         LM_HASH_HALF:PLAINTEXT
@@ -10,22 +44,126 @@ def load_pot_file(pot_file):
         D9D99F2F2B43B62F:1234567
 
     Returns:
-        dict: A dictionary where keys are LM hash halves (uppercase) and values are plaintext passwords.
+        PotIndex: The halves as sorted 8-byte keys (LM hashes are case-insensitive) with their plaintexts.
+        If a half appears more than once, the last plaintext wins.
     """
-    pot_dict = {}
+    # The entries are kept in file order in the same compact form, then put in key order through sorted
+    # chunks of entry numbers, so no Python object is held per entry
+    line_keys = array('Q')
+    line_offsets = array('Q', [0])
+    line_plaintexts = bytearray()
     with open(pot_file, 'r', encoding='utf-8') as file:
         for line in file:
             parts = line.strip().split(':', 1)
             if len(parts) == 2:
-                lm_half, plaintext = parts
-                pot_dict[lm_half.upper()] = plaintext  # Store in uppercase (LM hashes are case-insensitive)
-    return pot_dict
+                key = parse_lm_half(parts[0])
+                if key is not None:
+                    line_keys.append(key)
+                    line_plaintexts += parts[1].encode('utf-8')
+                    line_offsets.append(len(line_plaintexts))
+
+    # Sorting is stable, so entries with the same key stay in file order, also across chunks in the merge
+    chunks = [array('Q', sorted(range(start, min(start + POT_SORT_CHUNK_SIZE, len(line_keys))), key=line_keys.__getitem__))
+              for start in range(0, len(line_keys), POT_SORT_CHUNK_SIZE)]
+    keys = array('Q')
+    offsets = array('Q', [0])
+    plaintexts = bytearray()
+    previous = None
+    for entry in heapq.merge(*chunks, key=line_keys.__getitem__):
+        key = line_keys[entry]
+        if key == previous:
+            # A later line has the same half
+            keys.pop()
+            offsets.pop()
+            del plaintexts[offsets[-1]:]
+        keys.append(key)
+        plaintexts += line_plaintexts[line_offsets[entry]:line_offsets[entry + 1]]
+        offsets.append(len(plaintexts))
+        previous = key
+    del line_keys, line_offsets, line_plaintexts, chunks
+    return PotIndex(keys, offsets, bytes(plaintexts))
 
-def process_lm_hash_file(lm_hash_file, pot_dict, export_full):
-    """Replace LM hash halves with plaintext equivalents.
+def lookup_half(pot, lm_half):
+    """Binary search the POT index for a 16 character LM hash half. Returns its plaintext as bytes, or None."""
+    key = parse_lm_half(lm_half)
+    if key is None:
+        return None
+    pos = bisect_left(pot.keys, key)
+    if pos == len(pot.keys) or pot.keys[pos] != key:
+        return None
+    return pot.plaintexts[pot.offsets[pos]:pot.offsets[pos + 1]]
+
+def load_nt_hashes(dcsync_file):
+    """Load the NT hashes of every LM hash in a dcsync file, to resolve the case of joined LM plaintexts.
+
+    Expected format (each line in the file):
+        DOMAIN\\user:RID:<32 Character LM Hash>:<32 Character NT Hash>:::
+
+    Returns:
+        dict: Full LM hashes (uppercase) mapped to the tuple of NT hash digests (16 bytes) of the accounts using them.
+    """
+    nt_hashes = {}
+    with open(dcsync_file, 'r', encoding='utf-8', errors='replace') as file:
+        for line in file:
+            fields = line.strip().split(':')
+            if len(fields) < 4 or len(fields[2]) != 32 or len(fields[3]) != 32:
+                continue
+            try:
+                digest = bytes.fromhex(fields[3])
+            except ValueError:
+                continue
+            lm_hash = fields[2].upper()
+            if digest not in nt_hashes.get(lm_hash, ()):
+                nt_hashes[lm_hash] = nt_hashes.get(lm_hash, ()) + (digest,)
+    return nt_hashes
+
+def case_variants(plaintext):
+    """Yield every upper/lower case variant of an LM plaintext (LM hashes uppercase the password).
+    The usual forms (lowercase, capitalised, uppercase) come first, then the rest in Gray-code order,
+    where every variant differs from the previous one in a single letter."""
+    common = [plaintext.lower(), plaintext.capitalize(), plaintext.upper()]
+    yield from dict.fromkeys(common)
+    chars = list(plaintext.lower())
+    positions = [pos for pos, char in enumerate(chars) if char.upper() != char]
+    for step in range(1, 1 << len(positions)):
+        pos = positions[(step & -step).bit_length() - 1]
+        chars[pos] = chars[pos].upper() if chars[pos].islower() else chars[pos].lower()
+        variant = ''.join(chars)
+        if variant not in common:
+            yield variant
+
+def resolve_case(plaintext, digests):
+    """Find the case variant of an uppercase LM plaintext whose NT hash is one of the given digests,
+    stopping at the first match. Returns the password as bytes, or None if no variant matches."""
+    for variant in case_variants(plaintext.decode('utf-8', errors='replace')):
+        if nt_hash(variant) in digests:
+            return variant.encode('utf-8')
+    return None
+
+def join_hash(task):
+    """Build the output line of one full LM hash from its looked up halves (None if not cracked).
+    With NT hash digests and both halves cracked, the real mixed-case password replaces the LM plaintext.
+    Returns the number of cracked halves, whether the case was resolved, and the line as bytes."""
+    full_lm_hash, plain_first, plain_second, digests, export_full = task
+    cracked = (plain_first is not None) + (plain_second is not None)
+    resolved = None
+    if cracked == 2 and digests:
+        resolved = resolve_case(plain_first + plain_second, digests)
+    if resolved is not None:
+        plaintext = resolved
+    else:
+        not_found = HASH_NOT_FOUND.encode('utf-8')
+        plaintext = (not_found if plain_first is None else plain_first) + (not_found if plain_second is None else plain_second)
+    if export_full:
+        return cracked, resolved is not None, full_lm_hash.encode('utf-8') + b':' + plaintext + b'\n'
+    return cracked, resolved is not None, plaintext + b'\n'
+
+def process_lm_hash_file(lm_hash_file, pot, export_full, output_file, nt_hashes=None, workers=1):
+    """Replace LM hash halves with plaintext equivalents and stream the results to output_file.
     This is used when you crack LM hashes and need to join them back together to make a full password
     The password list should then be run through the case-permutation.py script and used as a password list against
-    the NT hashes remaining. 
+    the NT hashes remaining. With nt_hashes that step is done in-process instead: the case variants of every fully
+    cracked hash are NT hashed on a pool of workers until one matches, and the real password is written.
     
     Expected format of `lm_hash_file` (each line contains a full LM hash - 32 characters long):
         FULL_LM_HASH
@@ -33,35 +171,48 @@ def process_lm_hash_file(lm_hash_file, pot_dict, export_full):
         299BD128C1101FD6D9D99F2F2B43B62F
         5D41402ABC4B2A76A5E7C9A317E4B403
 
-    If a half-hash is found in the `pot_dict`, it is replaced with its plaintext equivalent.
+    If a half-hash is found in the `pot`, it is replaced with its plaintext equivalent.
     If not found, it is replaced with '<HASH_NOT_FOUND>' to indicate missing data.
 
     Args:
         lm_hash_file (str): Path to a file containing full LM hashes.
-        pot_dict (dict): Dictionary mapping LM hash halves to plaintexts.
+        pot (PotIndex): Index of LM hash halves and their plaintexts from load_pot_file.
         export_full (bool): If True, output will include full LM hash along with plaintext.
+        output_file (str): Path of the output file, written through a buffered writer as the hashes are read.
+        nt_hashes (dict): Optional NT hash digests per full LM hash from load_nt_hashes, to resolve the case.
+        workers (int): Number of worker processes used to resolve the case.
 
     Returns:
-        list: List of formatted output strings with plaintext replacements.
+        Counter: How many hashes had both halves, one half and no halves cracked ('both', 'one', 'none'),
+        and with nt_hashes how many had their case resolved ('resolved').
     """
-    output_lines = []
-    
-    with open(lm_hash_file, 'r', encoding='utf-8') as file:
-        for line in file:
-            full_lm_hash = line.strip().upper()  # Ensure uppercase
-            if len(full_lm_hash) != 32:
-                continue  # Skip invalid lines
-            
-            first_half, second_half = full_lm_hash[:16], full_lm_hash[16:]
-            plain_first = pot_dict.get(first_half, <'HASH_NOT_FOUND>')  # Use HASH_NOT_FOUND if not found
-            plain_second = pot_dict.get(second_half, '<HASH_NOT_FOUND>')
-
-            if export_full:
-                output_lines.append(f"{full_lm_hash}:{plain_first}{plain_second}")
-            else:
-                output_lines.append(f"{plain_first}{plain_second}")
+    stats = Counter(both=0, one=0, none=0, resolved=0)
+
+    with open(lm_hash_file, 'r', encoding='utf-8') as file, \
+         open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as out_file:
+        def tasks():
+            for line in file:
+                full_lm_hash = line.strip().upper()  # Ensure uppercase
+                if len(full_lm_hash) != 32:
+                    continue  # Skip invalid lines
+                
+                first_half, second_half = full_lm_hash[:16], full_lm_hash[16:]
+                digests = nt_hashes.get(full_lm_hash) if nt_hashes else None
+                yield full_lm_hash, lookup_half(pot, first_half), lookup_half(pot, second_half), digests, export_full
+
+        # Only resolving the case is worth a pool; results come back in input order
+        pool = multiprocessing.Pool(workers) if nt_hashes and workers > 1 else None
+        try:
+            results = pool.imap(join_hash, tasks(), RESOLVE_CHUNK_SIZE) if pool else map(join_hash, tasks())
+            for cracked, resolved, line in results:
+                stats[('none', 'one', 'both')[cracked]] += 1
+                stats['resolved'] += resolved
+                out_file.write(line)
+        finally:
+            if pool:
+                pool.terminate()
     
-    return output_lines
+    return stats
 
 def main():
     parser = argparse.ArgumentParser(description="Replace LM hash halves with plaintext from a POT file.")
@@ -79,6 +230,18 @@ def main():
         help="Path to the output file where results will be saved. Default: 'output.txt'.",
         default="output.txt"
     )
+    parser.add_argument(
+        "--resolve-nt",
+        metavar="DCSYNC_FILE",
+        help="dcsync file (user:rid:LM:NT:::) with the NT hashes of the accounts. For every fully cracked LM hash, "
+             "the case variants of the plaintext are NT hashed until one matches, and the real password is output."
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes for --resolve-nt. Default: all cores."
+    )
     parser.add_argument(
         "--full",
         action="store_true",
@@ -88,13 +251,19 @@ def main():
     
     args = parser.parse_args()
     
-    pot_dict = load_pot_file(args.pot_file)
-    results = process_lm_hash_file(args.lm_hash_file, pot_dict, args.full)
-
-    with open(args.output, "w", encoding="utf-8") as out_file:
-        out_file.write("\n".join(results) + "\n")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
     
+    pot = load_pot_file(args.pot_file)
+    nt_hashes = load_nt_hashes(args.resolve_nt) if args.resolve_nt else None
+    stats = process_lm_hash_file(args.lm_hash_file, pot, args.full, args.output, nt_hashes, args.workers)
+
     print(f"Processing complete. Results saved to {args.output}")
+    print(f"Both halves cracked: {stats['both']}")
+    print(f"One half cracked: {stats['one']}")
+    print(f"No halves cracked: {stats['none']}")
+    if nt_hashes is not None:
+        print(f"Case resolved from NT hashes: {stats['resolved']}")
 
 if __name__ == "__main__":
     main()
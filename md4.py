@@ -0,0 +1,61 @@
+import hashlib
+import struct
+
+# MD4 (RFC 1320), needed for NT hashes. OpenSSL 3 disables md4 in hashlib unless the legacy provider is
+# loaded, so a pure Python implementation is bundled and used whenever hashlib cannot provide it.
+
+MASK = 0xFFFFFFFF
+
+def _rotate_left(value, bits):
+    value &= MASK
+    return ((value << bits) | (value >> (32 - bits))) & MASK
+
+def md4_python(data):
+    """
+    Returns the MD4 digest of data (bytes), computed in pure Python.
+    """
+    message = bytes(data)
+    bit_length = (len(message) * 8) & 0xFFFFFFFFFFFFFFFF
+    message += b"\x80" + bytes(-(len(message) + 9) % 64) + struct.pack("<Q", bit_length)
+    a, b, c, d = 0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476
+    for offset in range(0, len(message), 64):
+        x = struct.unpack_from("<16I", message, offset)
+        aa, bb, cc, dd = a, b, c, d
+        # Round 1: F(x, y, z) = (x & y) | (~x & z)
+        for i in (0, 4, 8, 12):
+            a = _rotate_left(a + ((b & c) | (~b & d)) + x[i], 3)
+            d = _rotate_left(d + ((a & b) | (~a & c)) + x[i + 1], 7)
+            c = _rotate_left(c + ((d & a) | (~d & b)) + x[i + 2], 11)
+            b = _rotate_left(b + ((c & d) | (~c & a)) + x[i + 3], 19)
+        # Round 2: G(x, y, z) = majority of x, y, z
+        for i in (0, 1, 2, 3):
+            a = _rotate_left(a + ((b & c) | (b & d) | (c & d)) + x[i] + 0x5A827999, 3)
+            d = _rotate_left(d + ((a & b) | (a & c) | (b & c)) + x[i + 4] + 0x5A827999, 5)
+            c = _rotate_left(c + ((d & a) | (d & b) | (a & b)) + x[i + 8] + 0x5A827999, 9)
+            b = _rotate_left(b + ((c & d) | (c & a) | (d & a)) + x[i + 12] + 0x5A827999, 13)
+        # Round 3: H(x, y, z) = x ^ y ^ z
+        for i in (0, 2, 1, 3):
+            a = _rotate_left(a + (b ^ c ^ d) + x[i] + 0x6ED9EBA1, 3)
+            d = _rotate_left(d + (a ^ b ^ c) + x[i + 8] + 0x6ED9EBA1, 9)
+            c = _rotate_left(c + (d ^ a ^ b) + x[i + 4] + 0x6ED9EBA1, 11)
+            b = _rotate_left(b + (c ^ d ^ a) + x[i + 12] + 0x6ED9EBA1, 15)
+        a, b, c, d = (a + aa) & MASK, (b + bb) & MASK, (c + cc) & MASK, (d + dd) & MASK
+    return struct.pack("<4I", a, b, c, d)
+
+def md4_hashlib(data):
+    """
+    Returns the MD4 digest of data (bytes) from hashlib (OpenSSL).
+    """
+    return hashlib.new("md4", data).digest()
+
+try:
+    hashlib.new("md4")
+    md4 = md4_hashlib
+except ValueError:
+    md4 = md4_python
+
+def nt_hash(password):
+    """
+    Returns the NT hash of a password: the 16 byte MD4 digest of its UTF-16LE encoding.
+    """
+    return md4(password.encode("utf-16-le"))
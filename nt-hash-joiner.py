@@ -1,36 +1,420 @@
 import argparse
+import binascii
+import hashlib
+import heapq
+import itertools
+import mmap
+import multiprocessing
+import os
+import signal
+import struct
+import tempfile
+import time
+from collections import Counter, defaultdict
 
-def load_pot_file(pot_file):
+# Persistent pot index: <pot>.ntidx holds one sorted record per NT hash of the pot file, <pot>.ntidx.delta the
+# records of lines appended since, which are merged into the main index once the delta grows large enough.
+# Each segment is: header | records, all memory-mapped and searched without parsing the pot again.
+POT_INDEX_MAGIC = b"NTPOTIX1"
+
+# magic, record count, pot file byte range [start, end) the records cover, SHA-1 of the pot bytes just before end
+POT_INDEX_HEADER = struct.Struct("<8sQQQ20s")
+
+# NT hash and offset of the plaintext in the pot file. Big-endian, so records sort by hash as plain bytes
+POT_RECORD = struct.Struct(">16sQ")
+
+# First 8 bytes of a record's hash as an integer, used by the interpolation search
+RECORD_KEY = struct.Struct(">Q")
+
+# Interpolation guesses per lookup before the search falls back to bisection (uniform hashes need ~4 for 10^6 records)
+INTERPOLATION_STEPS = 8
+
+# Bytes of the pot file before the indexed end that must be unchanged for the index to be reused
+FINGERPRINT_SIZE = 4096
+
+# Records sorted in memory at a time while building an index, larger pots are sorted in runs and merged
+SORT_RUN_RECORDS = 1 << 20
+
+# The delta is merged into the main index once it has 1/DELTA_MERGE_RATIO of its records (and at least DELTA_MERGE_MIN)
+DELTA_MERGE_RATIO = 8
+DELTA_MERGE_MIN = 1 << 16
+
+# Bytes of the hash file parsed per task, split on line boundaries
+CHUNK_SIZE = 4 << 20
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+HASH_NOT_FOUND = b"<HASH_NOT_FOUND>"
+
+# Seconds between checks of the pot files for new lines in --watch mode
+WATCH_INTERVAL = 5.0
+
+# Set in every worker process by init_worker
+_worker_pots = None
+_worker_hash_file = None
+_worker_export_full = False
+
+def pot_fingerprint(pot_data, end):
+    """
+    SHA-1 of the pot bytes just before end, used to detect a rewritten pot file.
     """
-    Load the POT file into a dictionary mapping NT hashes to plaintext passwords.
+    return hashlib.sha1(pot_data[max(0, end - FINGERPRINT_SIZE):end]).digest()
+
+def parse_pot_records(pot_data, start, end):
+    """
+    Parse the pot lines in pot_data[start:end] into index records.
 
     Expected formats (each line in the file):
       - John format: $NT$<32 Character NT Hash>:<password>
       - Hashcat format: <32 Character NT Hash>:<password>
+    """
+    pos = start
+    while pos < end:
+        newline = pot_data.find(b"\n", pos, end)
+        line_end = end if newline == -1 else newline
+        line = pot_data[pos:line_end]
+        stripped = line.strip()
+        skipped = len(line) - len(line.lstrip())
+        # Remove the $NT$ prefix if present (John format)
+        if stripped.startswith(b"$NT$"):
+            stripped = stripped[len(b"$NT$"):]
+            skipped += len(b"$NT$")
+        if stripped.find(b":") == 32:
+            try:
+                yield POT_RECORD.pack(binascii.unhexlify(stripped[:32]), pos + skipped + 33)
+            except binascii.Error:
+                pass
+        pos = line_end + 1
 
-    Returns:
-        dict: A dictionary where keys are NT hashes (uppercase) and values are plaintext passwords.
-    """
-    pot_dict = {}
-    with open(pot_file, 'r', encoding='utf-8') as file:
-        for line in file:
-            line = line.strip()
-            if not line:
-                continue
-            # Remove the $NT$ prefix if present (John format)
-            if line.startswith("$NT$"):
-                line = line[len("$NT$"):]
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                nt_hash, plaintext = parts
-                nt_hash = nt_hash.upper()
-                if len(nt_hash) == 32:
-                    pot_dict[nt_hash] = plaintext
-    return pot_dict
-
-def process_hash_file(hash_file, pot_dict, export_full):
-    """
-    Replace NT hashes with their plaintext equivalents.
+def read_records(file):
+    """
+    Read the records of a spilled sort run.
+    """
+    while True:
+        record = file.read(POT_RECORD.size)
+        if not record:
+            return
+        yield record
+
+def sort_records(records):
+    """
+    Sort index records. Runs of SORT_RUN_RECORDS are sorted in memory, spilled to temporary files and merged.
+    """
+    run, run_files = [], []
+    for record in records:
+        run.append(record)
+        if len(run) == SORT_RUN_RECORDS:
+            run.sort()
+            run_file = tempfile.TemporaryFile()
+            run_file.write(b"".join(run))
+            run_file.seek(0)
+            run_files.append(run_file)
+            run = []
+    run.sort()
+    if not run_files:
+        return iter(run)
+    return heapq.merge(*(read_records(run_file) for run_file in run_files), run)
+
+def latest_records(sorted_records):
+    """
+    Keep one record per NT hash: the one of the last line of the pot file, like a dict filled line by line.
+    """
+    for _, group in itertools.groupby(sorted_records, key=lambda record: record[:16]):
+        for record in group:
+            pass
+        yield record
+
+def write_pot_segment(segment_file, sorted_records, start, end, fingerprint):
+    """
+    Write an index segment atomically from sorted, unique records.
+    """
+    tmp_file = segment_file + ".tmp"
+    count = 0
+    with open(tmp_file, "wb") as f:
+        f.write(bytes(POT_INDEX_HEADER.size))
+        for record in sorted_records:
+            f.write(record)
+            count += 1
+        f.seek(0)
+        f.write(POT_INDEX_HEADER.pack(POT_INDEX_MAGIC, count, start, end, fingerprint))
+    os.replace(tmp_file, segment_file)
+
+class PotSegment:
+    """
+    One memory-mapped index segment: sorted records of the pot lines in [start, end).
+    """
+    def __init__(self, segment_file):
+        with open(segment_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.count, self.start, self.end, self.fingerprint = POT_INDEX_HEADER.unpack_from(self._mmap)
+            if magic != POT_INDEX_MAGIC or len(self._mmap) != POT_INDEX_HEADER.size + self.count * POT_RECORD.size:
+                raise ValueError(f"{segment_file} is not a valid pot index")
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise
+
+    def _hash(self, index):
+        offset = POT_INDEX_HEADER.size + index * POT_RECORD.size
+        return self._mmap[offset:offset + 16]
+
+    def _key(self, index):
+        return RECORD_KEY.unpack_from(self._mmap, POT_INDEX_HEADER.size + index * POT_RECORD.size)[0]
+
+    def find(self, digest):
+        """
+        Interpolation search for an NT hash digest. NT hashes are uniformly distributed, so the position of
+        a hash between the keys bounding the remaining range is a very good guess and only a few records
+        are read. Should the hashes not be uniform (a crafted pot), it falls back to bisection after
+        INTERPOLATION_STEPS guesses.
+        Returns the offset of its plaintext in the pot file, or None.
+        """
+        target = int.from_bytes(digest[:8], "big")
+        records, header_size, record_size, unpack_key = self._mmap, POT_INDEX_HEADER.size, POT_RECORD.size, RECORD_KEY.unpack_from
+        # Keys below low are < target, keys from high on are > target; low_key and high_key bound them
+        low, high = 0, self.count
+        low_key, high_key = -1, 1 << 64
+        steps = 0
+        while low < high:
+            if steps < INTERPOLATION_STEPS:
+                middle = low + (target - low_key) * (high - low) // (high_key - low_key)
+                steps += 1
+            else:
+                middle = (low + high) // 2
+            middle_key = unpack_key(records, header_size + middle * record_size)[0]
+            if middle_key < target:
+                low, low_key = middle + 1, middle_key
+            elif middle_key > target:
+                high, high_key = middle, middle_key
+            elif self._hash(middle) == digest:
+                return POT_RECORD.unpack_from(records, header_size + middle * record_size)[1]
+            else:
+                # Only the first 8 bytes match; compare the whole hashes of all records with this key
+                while middle > low and self._key(middle - 1) == target:
+                    middle -= 1
+                while middle < high and self._key(middle) == target:
+                    if self._hash(middle) == digest:
+                        return POT_RECORD.unpack_from(records, header_size + middle * record_size)[1]
+                    middle += 1
+                return None
+        return None
+
+    def records(self):
+        for index in range(self.count):
+            offset = POT_INDEX_HEADER.size + index * POT_RECORD.size
+            yield self._mmap[offset:offset + POT_RECORD.size]
+
+    def close(self):
+        self._mmap.close()
+
+def open_segment(segment_file, pot_data, start):
+    """
+    Open an index segment if it exists and still matches the pot file, otherwise remove it and return None.
+    """
+    try:
+        segment = PotSegment(segment_file)
+    except (OSError, ValueError, struct.error):
+        segment = None
+    if segment is not None:
+        if segment.start == start and segment.end <= len(pot_data) and segment.fingerprint == pot_fingerprint(pot_data, segment.end):
+            return segment
+        segment.close()
+    if os.path.exists(segment_file):
+        os.remove(segment_file)
+    return None
+
+class PotIndex:
+    """
+    NT hash lookups in a pot file through its persistent index (<pot>.ntidx and <pot>.ntidx.delta).
+
+    Opening the index only parses the lines appended to the pot since the last run: they are added to the
+    small delta segment, which is merged into the main index once it grows large enough. A rewritten pot
+    file is detected and indexed again. Lines are indexed once they end with a newline; a last line that
+    does not is looked up from memory. indexed_end is the end of the pot lines in the index files.
+
+    With update=False the index files are opened as they are (e.g. by worker processes, after the main
+    process updated them) and anything appended to the pot after them is looked up from memory.
+    """
+    def __init__(self, pot_file, update=True):
+        self.main_file = pot_file + ".ntidx"
+        self.delta_file = pot_file + ".ntidx.delta"
+        with open(pot_file, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._pot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if not update:
+            self.main = PotSegment(self.main_file)
+            self.delta = PotSegment(self.delta_file) if os.path.exists(self.delta_file) else None
+            if self.delta and self.delta.start != self.main.end:
+                self.delta.close()
+                self.delta = None
+            indexed_end = self.delta.end if self.delta else self.main.end
+            self.indexed_end = indexed_end
+            self._tail = {record[:16]: POT_RECORD.unpack(record)[1] for record in parse_pot_records(self._pot, indexed_end, size)}
+            return
+        indexed_end = self._pot.rfind(b"\n") + 1
+        self.indexed_end = indexed_end
+
+        self.main = open_segment(self.main_file, self._pot, 0)
+        if self.main is None:
+            records = latest_records(sort_records(parse_pot_records(self._pot, 0, indexed_end)))
+            write_pot_segment(self.main_file, records, 0, indexed_end, pot_fingerprint(self._pot, indexed_end))
+            self.main = PotSegment(self.main_file)
+
+        self.delta = open_segment(self.delta_file, self._pot, self.main.end)
+        covered = self.delta.end if self.delta else self.main.end
+        if covered < indexed_end:
+            new_records = list(parse_pot_records(self._pot, covered, indexed_end))
+            if self.delta:
+                new_records.extend(self.delta.records())
+                self.delta.close()
+                self.delta = None
+            records = list(latest_records(sorted(new_records)))
+            fingerprint = pot_fingerprint(self._pot, indexed_end)
+            if len(records) >= max(DELTA_MERGE_MIN, self.main.count // DELTA_MERGE_RATIO):
+                merged = latest_records(heapq.merge(self.main.records(), records))
+                write_pot_segment(self.main_file + ".merge", merged, 0, indexed_end, fingerprint)
+                self.main.close()
+                os.replace(self.main_file + ".merge", self.main_file)
+                self.main = PotSegment(self.main_file)
+                if os.path.exists(self.delta_file):
+                    os.remove(self.delta_file)
+            else:
+                write_pot_segment(self.delta_file, records, self.main.end, indexed_end, fingerprint)
+                self.delta = PotSegment(self.delta_file)
+
+        # A last line without a newline may still be being written, so it only lives in memory
+        self._tail = {record[:16]: POT_RECORD.unpack(record)[1] for record in parse_pot_records(self._pot, indexed_end, size)}
+
+    def __len__(self):
+        return self.main.count + (self.delta.count if self.delta else 0) + len(self._tail)
+
+    def plaintext_bytes(self, nt_hash):
+        """
+        Return the plaintext (UTF-8 bytes) of a 32 character hex NT hash (str or bytes), or None.
+        Newer lines win over older ones.
+        """
+        try:
+            digest = binascii.unhexlify(nt_hash)
+        except (binascii.Error, ValueError):
+            return None
+        offset = self._tail.get(digest)
+        if offset is None and self.delta:
+            offset = self.delta.find(digest)
+        if offset is None:
+            offset = self.main.find(digest)
+        if offset is None:
+            return None
+        line_end = self._pot.find(b"\n", offset)
+        return self._pot[offset:len(self._pot) if line_end == -1 else line_end].rstrip()
+
+    def get(self, nt_hash, default=None):
+        """
+        Return the plaintext of a 32 character hex NT hash, or default.
+        """
+        plaintext = self.plaintext_bytes(nt_hash)
+        return default if plaintext is None else plaintext.decode("utf-8", errors="replace")
+
+    def close(self):
+        self.main.close()
+        if self.delta:
+            self.delta.close()
+        if isinstance(self._pot, mmap.mmap):
+            self._pot.close()
+
+def hash_file_chunks(hash_file, chunk_size=CHUNK_SIZE):
+    """
+    Split the hash file into byte ranges of about chunk_size, each ending after a newline (or at the end of the file).
+    """
+    size = os.path.getsize(hash_file)
+    with open(hash_file, "rb") as file:
+        start = 0
+        while start < size:
+            file.seek(min(start + chunk_size, size) - 1)
+            file.readline()
+            end = min(file.tell(), size)
+            yield start, end
+            start = end
+
+def parse_hash_line(line):
+    """
+    Parse one line of the hash file (bytes) into (fields, NT hash), or None if it holds no valid NT hash.
+    fields is the list of colon separated fields of a dcsync line, or None for a plain NT hash line.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    # Check if the line is in dcsync file format (colon separated with at least 4 fields and the 3rd field equals "LM")
+    fields = line.split(b":")
+    if len(fields) >= 4 and fields[2].upper() == b"LM":
+        nt_hash = fields[3].upper()
+        if len(nt_hash) != 32:
+            return None  # Skip if not a valid NT hash
+        return fields, nt_hash
+
+    # Otherwise assume the line is a simple NT file format (just a 32-character hash)
+    nt_hash = line.upper()
+    if len(nt_hash) != 32:
+        return None  # Skip invalid lines
+    return None, nt_hash
+
+def format_output_line(fields, nt_hash, plaintext, export_full):
+    """
+    Return the output line of a parsed hash file line (without newline); plaintext is None if not cracked.
+    """
+    if plaintext is None:
+        plaintext = HASH_NOT_FOUND
+    if not export_full:
+        return plaintext
+    if fields is None:
+        return nt_hash + b":" + plaintext
+    # Replace the NT hash in its original location (fourth field) with the plaintext
+    fields = list(fields)
+    fields[3] = plaintext
+    return b":".join(fields)
+
+def lookup_plaintext(pots, nt_hash):
+    """
+    Look up an NT hash in several pot indexes; like concatenated pot files, the last pot with the hash wins.
+    """
+    for pot in reversed(pots):
+        plaintext = pot.plaintext_bytes(nt_hash)
+        if plaintext is not None:
+            return plaintext
+    return None
+
+def join_lines(data, pots, export_full):
+    """
+    Replace the NT hashes in a chunk of the hash file (bytes, whole lines) and return the output lines.
+    """
+    output_lines = []
+    for line in data.split(b"\n"):
+        parsed = parse_hash_line(line)
+        if parsed is None:
+            continue
+        fields, nt_hash = parsed
+        output_lines.append(format_output_line(fields, nt_hash, lookup_plaintext(pots, nt_hash), export_full))
+    return output_lines
+
+def init_worker(pot_files, hash_file, export_full):
+    global _worker_pots, _worker_hash_file, _worker_export_full
+    _worker_pots = [PotIndex(pot_file, update=False) for pot_file in pot_files]
+    _worker_hash_file = hash_file
+    _worker_export_full = export_full
+
+def join_chunk(chunk):
+    """
+    Worker task: read one byte range of the hash file and return its output lines as one block of bytes.
+    """
+    start, end = chunk
+    with open(_worker_hash_file, "rb") as file:
+        file.seek(start)
+        output_lines = join_lines(file.read(end - start), _worker_pots, _worker_export_full)
+    return len(output_lines), b"".join(line + b"\n" for line in output_lines)
+
+def process_hash_file(hash_file, pots, export_full, output_file, workers=1, pot_files=None):
+    """
+    Replace NT hashes with their plaintext equivalents and stream the results to output_file.
 
     The hash file can be in one of two formats:
       - dcsync file: value:value:LM:<32 Character NT Hash>:::
@@ -38,49 +422,186 @@ def process_hash_file(hash_file, pot_dict, export_full):
 
     For a dcsync file, the script replaces the fourth field (index 3) with the plaintext
     (if found in the pot file). For an NT file, it simply looks up the hash.
+
+    The file is split into byte ranges on line boundaries that are parsed as bytes, by a pool of
+    workers if workers > 1; their output is written in the original line order.
     
     Args:
         hash_file (str): Path to the file containing NT hashes.
-        pot_dict (dict): Dictionary mapping NT hashes (uppercase) to plaintext passwords.
+        pots (list): PotIndex of every pot file, mapping NT hashes (uppercase) to plaintext passwords.
         export_full (bool): If True, output the full line with the NT hash substituted by plaintext.
                             Otherwise, only output the plaintext.
+        output_file (str): Path of the output file.
+        workers (int): Number of worker processes.
+        pot_files (list): Paths of the pot files, from which the workers open the indexes of pots.
                             
     Returns:
-        list: List of formatted output strings with substituted plaintext.
+        int: Number of output lines written.
     """
-    output_lines = []
-    
-    with open(hash_file, 'r', encoding='utf-8') as file:
-        for line in file:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Check if the line is in dcsync file format (colon separated with at least 4 fields and the 3rd field equals "LM")
-            fields = line.split(':')
-            if len(fields) >= 4 and fields[2].upper() == "LM":
-                nt_hash = fields[3].upper()
-                if len(nt_hash) != 32:
-                    continue  # Skip if not a valid NT hash
-                plaintext = pot_dict.get(nt_hash, "<HASH_NOT_FOUND>")
-                if export_full:
-                    # Replace the NT hash in its original location (fourth field) with the plaintext
-                    fields[3] = plaintext
-                    output_lines.append(":".join(fields))
-                else:
-                    output_lines.append(plaintext)
-            else:
-                # Otherwise assume the line is a simple NT file format (just a 32-character hash)
-                nt_hash = line.upper()
-                if len(nt_hash) != 32:
-                    continue  # Skip invalid lines
-                plaintext = pot_dict.get(nt_hash, "<HASH_NOT_FOUND>")
-                if export_full:
-                    output_lines.append(f"{nt_hash}:{plaintext}")
-                else:
-                    output_lines.append(plaintext)
-    
-    return output_lines
+    written = 0
+    with open(output_file, "wb", buffering=WRITE_BUFFER_SIZE) as out_file:
+        if workers > 1 and pot_files:
+            with multiprocessing.Pool(workers, initializer=init_worker, initargs=(pot_files, hash_file, export_full)) as pool:
+                for count, block in pool.imap(join_chunk, hash_file_chunks(hash_file)):
+                    out_file.write(block)
+                    written += count
+        else:
+            with open(hash_file, "rb") as file:
+                for start, end in hash_file_chunks(hash_file):
+                    file.seek(start)
+                    output_lines = join_lines(file.read(end - start), pots, export_full)
+                    out_file.write(b"".join(line + b"\n" for line in output_lines))
+                    written += len(output_lines)
+        if not written:
+            out_file.write(b"\n")
+    return written
+
+class WatchState:
+    """
+    Output of the hash file kept up to date while pot files grow (--watch).
+
+    Every NT hash maps to the hash file lines it appears on (the reverse index), so a new crack only
+    touches its own lines. The cracked count and the number of accounts sharing a password with
+    another account are updated along with them.
+    """
+    def __init__(self, hash_file, pots, export_full):
+        self.export_full = export_full
+        self.entries = []
+        self.output_lines = []
+        self.lines = defaultdict(list)
+        self.plaintexts = {}
+        self.password_counts = Counter()
+        self.cracked = 0
+        self.reused = 0
+        with open(hash_file, "rb") as file:
+            for line in file:
+                parsed = parse_hash_line(line)
+                if parsed is None:
+                    continue
+                fields, nt_hash = parsed
+                self.entries.append(parsed)
+                self.output_lines.append(format_output_line(fields, nt_hash, None, export_full))
+                self.lines[nt_hash].append(len(self.entries) - 1)
+        for nt_hash in self.lines:
+            plaintext = lookup_plaintext(pots, nt_hash)
+            if plaintext is not None:
+                self.crack(nt_hash, plaintext)
+
+    def _count_password(self, plaintext, accounts):
+        """
+        Add (or remove, if negative) accounts using plaintext and update the number of accounts sharing a password.
+        """
+        before = self.password_counts[plaintext]
+        after = before + accounts
+        self.password_counts[plaintext] = after
+        self.reused += (after if after > 1 else 0) - (before if before > 1 else 0)
+
+    def crack(self, nt_hash, plaintext):
+        """
+        Record the plaintext of an NT hash. Like in a pot file, a later plaintext replaces an earlier one.
+        Returns the indexes of the output lines that changed.
+        """
+        lines = self.lines.get(nt_hash)
+        previous = self.plaintexts.get(nt_hash)
+        if not lines or previous == plaintext:
+            return []
+        self.plaintexts[nt_hash] = plaintext
+        for index in lines:
+            fields, _ = self.entries[index]
+            self.output_lines[index] = format_output_line(fields, nt_hash, plaintext, self.export_full)
+        if previous is not None:
+            self._count_password(previous, -len(lines))
+        else:
+            self.cracked += len(lines)
+        self._count_password(plaintext, len(lines))
+        return lines
+
+    def summary(self):
+        total = len(self.entries)
+        percent = 100 * self.cracked / total if total else 0
+        return f"Cracked {self.cracked}/{total} ({percent:.2f}%), {self.reused} accounts share a password with another account"
+
+    def write(self, output_file):
+        """
+        Write the current output to output_file, replacing it atomically.
+        """
+        tmp_file = output_file + ".tmp"
+        with open(tmp_file, "wb", buffering=WRITE_BUFFER_SIZE) as out_file:
+            out_file.write(b"".join(line + b"\n" for line in self.output_lines) if self.output_lines else b"\n")
+        os.replace(tmp_file, output_file)
+        delta_file = watch_delta_file(output_file)
+        if os.path.exists(delta_file):
+            os.remove(delta_file)
+
+    def append_delta(self, output_file, indexes):
+        """
+        Append the given output lines to the delta file of output_file as <line number>:<output line>,
+        so a poll costs as much as its new cracks instead of a rewrite of the whole output.
+        """
+        with open(watch_delta_file(output_file), "ab") as delta:
+            delta.write(b"".join(b"%d:%s\n" % (index + 1, self.output_lines[index]) for index in dict.fromkeys(indexes)))
+
+def watch_delta_file(output_file):
+    """
+    The file collecting the output lines changed by new cracks since output_file was last written in --watch mode.
+    """
+    return output_file + ".delta"
+
+def read_new_pot_lines(pot_file, offset):
+    """
+    Read the complete lines appended to a pot file since offset. A shrunk pot file is read again from the start.
+    Returns (data, new offset).
+    """
+    size = os.path.getsize(pot_file)
+    if size < offset:
+        offset = 0
+    if size == offset:
+        return b"", offset
+    with open(pot_file, "rb") as file:
+        file.seek(offset)
+        data = file.read(size - offset)
+    data = data[:data.rfind(b"\n") + 1]
+    return data, offset + len(data)
+
+def watch_pot_files(pot_files, hash_file, output_file, export_full, interval=WATCH_INTERVAL):
+    """
+    Join the hash file against the pot files, then tail the pot files for newly cracked hashes until interrupted.
+    Only the output lines of new cracks are updated and appended to the delta file (see watch_delta_file); the
+    output file is rewritten in full on exit or, where the platform has it, when the process gets SIGUSR1.
+    """
+    pots = [PotIndex(pot_file) for pot_file in pot_files]
+    state = WatchState(hash_file, pots, export_full)
+    offsets = [pot.indexed_end for pot in pots]
+    for pot in pots:
+        pot.close()
+    state.write(output_file)
+    print(state.summary())
+
+    rewrite_requested = []
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: rewrite_requested.append(True))
+    try:
+        while True:
+            time.sleep(interval)
+            cracked_before, changed = state.cracked, []
+            for n, pot_file in enumerate(pot_files):
+                data, offsets[n] = read_new_pot_lines(pot_file, offsets[n])
+                for record in parse_pot_records(data, 0, len(data)):
+                    digest, offset = POT_RECORD.unpack(record)
+                    line_end = data.find(b"\n", offset)
+                    changed += state.crack(binascii.hexlify(digest).upper(), data[offset:line_end].rstrip())
+            if rewrite_requested:
+                rewrite_requested.clear()
+                state.write(output_file)
+                print(f"{time.strftime('%H:%M:%S')} {output_file} rewritten.")
+            elif changed:
+                state.append_delta(output_file, changed)
+            if changed:
+                print(f"{time.strftime('%H:%M:%S')} +{state.cracked - cracked_before} cracked. {state.summary()}")
+    except KeyboardInterrupt:
+        pass
+    state.write(output_file)
+    return state
 
 def main():
     parser = argparse.ArgumentParser(
@@ -89,8 +610,11 @@ def main():
                     "Hash file formats supported: dcsync file (value:value:LM:<32 NT hash>:::) or a simple NT file (<32 NT hash>)."
     )
     parser.add_argument(
-        "pot_file",
-        help="Path to the POT file containing NT hash to plaintext mappings."
+        "pot_files",
+        nargs="+",
+        metavar="pot_file",
+        help="Path to the POT file containing NT hash to plaintext mappings. Several POT files can be given "
+             "(John and Hashcat formats can be mixed); for a hash in more than one, the last file wins."
     )
     parser.add_argument(
         "hash_file",
@@ -107,14 +631,38 @@ def main():
         help="If set, output will include full original line structure with the NT hash replaced by the plaintext. "
              "Otherwise, only the plaintext is output."
     )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of worker processes parsing the hash file. Default: number of CPUs."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running while a cracking session is going: tail the POT files for new lines and update only the "
+             "output lines of newly cracked hashes, printing the cracked and reused password counts. Updated lines are "
+             "appended to <output>.delta as <line number>:<line>; the output is rewritten in full on Ctrl+C "
+             "(or on SIGUSR1 where available)."
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=WATCH_INTERVAL,
+        help=f"Seconds between checks of the POT files in --watch mode. Default: {WATCH_INTERVAL:g}."
+    )
     
     args = parser.parse_args()
     
-    pot_dict = load_pot_file(args.pot_file)
-    results = process_hash_file(args.hash_file, pot_dict, args.full)
+    if args.watch:
+        state = watch_pot_files(args.pot_files, args.hash_file, args.output, args.full, args.interval)
+        print(f"\nStopped watching. {state.summary()}. Results saved to {args.output}")
+        return
 
-    with open(args.output, "w", encoding="utf-8") as out_file:
-        out_file.write("\n".join(results) + "\n")
+    pots = [PotIndex(pot_file) for pot_file in args.pot_files]
+    process_hash_file(args.hash_file, pots, args.full, args.output, args.workers, args.pot_files)
+    for pot in pots:
+        pot.close()
     
     print(f"Processing complete. Results saved to {args.output}")
 
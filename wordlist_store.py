@@ -0,0 +1,345 @@
+import argparse
+import array
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+# A wordlist index holds every word of a wordlist in one contiguous blob plus an array of offsets, instead of
+# one Python str per word (~50-60 bytes of overhead each). It is memory-mapped, so opening it again is instant
+# and the operating system shares and pages it as needed.
+#
+# Layout: header | blob of all words | padding to 8 bytes | (count + 1) uint64 offsets into the blob
+INDEX_MAGIC = b"WLSTORE1"
+
+# magic, flags, word count, blob size, size and mtime (ns) of the wordlist the index was built from
+INDEX_HEADER = struct.Struct("<8sQQQQQ")
+
+FLAG_SORTED = 1       # Stripped, unique words in byte order (allows binary search)
+FLAG_LOWERCASE = 2    # Words were lowercased
+FLAG_BIG_ENDIAN = 4   # Offsets are in the byte order of the machine that built the index
+FLAG_STRIPPED = 8     # Stripped lines in file order, empty lines dropped
+FLAG_TABBED = 16      # Some word contains a tab (e.g. a numbered "word<TAB>rank" dictionary); not an option
+
+# Flags that describe the options an index was built with, i.e. the ones compared when reusing it
+OPTION_FLAGS = FLAG_SORTED | FLAG_LOWERCASE | FLAG_BIG_ENDIAN | FLAG_STRIPPED
+
+# Memory used by the sort runs when building a sorted index
+SORT_MEMORY_LIMIT = 256 * 1024 ** 2
+
+# Default --memory-limit of the scripts that sort or count out of core
+DEFAULT_MEMORY_LIMIT = "512M"
+
+# Approximate memory per word held in a sort run (bytes object and list slot), on top of its length
+RUN_WORD_OVERHEAD = 64
+
+# Most sorted runs merged at once; more runs are first merged into bigger ones
+MERGE_FAN_IN = 128
+
+# Indexes of wordlists in read-only directories are kept here instead, under a hash of the wordlist's path
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "wordlist-store")
+
+# Compiled English dictionary used by the Dictionary Manipulation scripts without --custom_dict. Building it is
+# the only time the NLTK corpus (and nltk itself) is needed, so it can be compiled once and copied to offline boxes.
+NLTK_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk-words.lower-sorted.wlidx")
+
+class WordlistStore:
+    """
+    Read-only, memory-mapped view of a wordlist index built by build_index.
+    """
+    def __init__(self, index_file):
+        self.index_file = index_file
+        with open(index_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.flags, self._count, self.blob_size, self.source_size, self.source_mtime = INDEX_HEADER.unpack_from(self._mmap)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{index_file} is not a wordlist index")
+            offsets_start = INDEX_HEADER.size + self.blob_size
+            offsets_start += -offsets_start % 8
+            offsets_end = offsets_start + 8 * (self._count + 1)
+            if offsets_end > len(self._mmap):
+                raise ValueError(f"{index_file} is truncated")
+            self._view = memoryview(self._mmap)
+            self._offsets = self._view[offsets_start:offsets_end].cast("Q")
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise
+
+    def __len__(self):
+        return self._count
+
+    def word_bytes(self, index):
+        """
+        Returns the UTF-8 bytes of the word at index.
+        """
+        start = INDEX_HEADER.size + self._offsets[index]
+        return self._mmap[start:INDEX_HEADER.size + self._offsets[index + 1]]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("wordlist index out of range")
+        return self.word_bytes(index).decode("utf-8", errors="replace")
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self.word_bytes(index).decode("utf-8", errors="replace")
+
+    def __contains__(self, word):
+        """
+        Binary search for a word. Only sorted stores support membership tests.
+        """
+        if not self.flags & FLAG_SORTED:
+            raise TypeError("membership tests need a sorted wordlist store (open_wordlist(..., sort=True))")
+        key = word.encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.word_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self._count and self.word_bytes(low) == key
+
+    def close(self):
+        self._offsets.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def index_flags(sort, lowercase, strip=False):
+    """
+    Returns the header flags of an index with the given options, built on this machine.
+    """
+    return ((FLAG_SORTED if sort else 0) | (FLAG_LOWERCASE if lowercase else 0)
+            | (FLAG_STRIPPED if strip and not sort else 0) | (FLAG_BIG_ENDIAN if sys.byteorder == "big" else 0))
+
+def default_index_file(wordlist_file, sort=False, lowercase=False, strip=False):
+    """
+    Returns the index file used for a wordlist, next to it, e.g. rockyou.txt.lower-sorted.wlidx.
+    """
+    variant = ("lower-" if lowercase else "") + ("sorted" if sort else "stripped" if strip else "lines")
+    return f"{wordlist_file}.{variant}.wlidx"
+
+def cache_index_file(wordlist_file, sort=False, lowercase=False, strip=False):
+    """
+    Returns the index file used for a wordlist whose own directory is read-only, in CACHE_DIR.
+    """
+    path_hash = hashlib.sha1(os.path.abspath(wordlist_file).encode("utf-8", errors="replace")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{path_hash}-{os.path.basename(default_index_file(wordlist_file, sort, lowercase, strip))}")
+
+def parse_memory_size(size):
+    """
+    Parses a size such as 512M, 2G or 100000 (bytes) for --memory-limit.
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    size = size.strip().upper().rstrip("B")
+    try:
+        if size and size[-1] in units:
+            return int(float(size[:-1]) * units[size[-1]])
+        return int(size)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {size!r} (e.g. 512M, 2G)")
+
+def read_run(file):
+    for line in file:
+        yield line[:-1]
+
+def write_run(records):
+    """
+    Writes sorted records to a temporary file, one per line, and returns it rewound.
+    """
+    run_file = tempfile.TemporaryFile()
+    for record in records:
+        run_file.write(record + b"\n")
+    run_file.seek(0)
+    return run_file
+
+def unique(sorted_records):
+    previous = None
+    for record in sorted_records:
+        if record != previous:
+            yield record
+            previous = record
+
+def external_sort(records, memory_limit):
+    """
+    Sorts and deduplicates records (bytes without newlines) in bounded memory: runs of about memory_limit bytes
+    are sorted in memory and spilled to temporary files, which are merged lazily (MERGE_FAN_IN at a time).
+    """
+    runs, run, run_size = [], [], 0
+    for record in records:
+        run.append(record)
+        run_size += len(record) + RUN_WORD_OVERHEAD
+        if run_size >= memory_limit:
+            runs.append(write_run(sorted(set(run))))
+            run, run_size = [], 0
+            if len(runs) == MERGE_FAN_IN:
+                runs = [write_run(unique(heapq.merge(*(read_run(run_file) for run_file in runs))))]
+    run = sorted(set(run))
+    if not runs:
+        return iter(run)
+    return unique(heapq.merge(*(read_run(run_file) for run_file in runs), run))
+
+def write_index(index_file, words, flags, source_size=0, source_mtime=0):
+    """
+    Writes an index of words (an iterable of bytes, in index order) atomically. FLAG_TABBED is set
+    here if any word contains a tab.
+    """
+    offsets = array.array("Q", [0])
+    tmp_file = index_file + ".tmp"
+    flags &= ~FLAG_TABBED
+    with open(tmp_file, "wb") as index:
+        index.write(bytes(INDEX_HEADER.size))
+        for word in words:
+            index.write(word)
+            offsets.append(offsets[-1] + len(word))
+            if not flags & FLAG_TABBED and b"\t" in word:
+                flags |= FLAG_TABBED
+        blob_size = offsets[-1]
+        index.write(bytes(-(INDEX_HEADER.size + blob_size) % 8))
+        offsets.tofile(index)
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, flags, len(offsets) - 1, blob_size, source_size, source_mtime))
+    os.replace(tmp_file, index_file)
+
+def build_index(wordlist_file, index_file, sort=False, lowercase=False, memory_limit=SORT_MEMORY_LIMIT, strip=False):
+    """
+    Builds the index of a wordlist. Without sort it keeps every line in file order (newline removed), or
+    with strip only the non-empty stripped lines; with sort it keeps the stripped, unique words in byte
+    order for binary search, sorted externally in runs of about memory_limit bytes.
+    """
+    stat = os.stat(wordlist_file)
+    with open(wordlist_file, "rb") as source:
+        if sort:
+            words = (line.strip() for line in source)
+            if lowercase:
+                words = (word.decode("utf-8", errors="replace").lower().encode("utf-8") for word in words)
+            lines = external_sort(words, memory_limit)
+        elif strip:
+            lines = (line for line in (line.strip() for line in source) if line)
+            if lowercase:
+                lines = (line.decode("utf-8", errors="replace").lower().encode("utf-8") for line in lines)
+        else:
+            lines = (line.rstrip(b"\r\n") for line in source)
+            if lowercase:
+                lines = (line.decode("utf-8", errors="replace").lower().encode("utf-8") for line in lines)
+        write_index(index_file, lines, index_flags(sort, lowercase, strip), stat.st_size, stat.st_mtime_ns)
+
+def build_nltk_index(index_file=NLTK_INDEX_FILE):
+    """
+    Compiles the NLTK words corpus into a sorted index, downloading the corpus first if it is missing.
+    Only the lowercase entries are kept: lookups lowercase the word first, so the capitalized ones never match.
+    """
+    import nltk
+    try:
+        nltk.data.find("corpora/words")
+    except LookupError:
+        nltk.download("words")
+    from nltk.corpus import words
+    english_words = sorted({word.encode("utf-8") for word in words.words() if word == word.lower()})
+    write_index(index_file, english_words, index_flags(sort=True, lowercase=True))
+
+def open_dictionary(custom_dict=None, index_file=NLTK_INDEX_FILE):
+    """
+    Opens the English dictionary used for word lookups as a sorted, lowercased WordlistStore: custom_dict if
+    given, otherwise the compiled NLTK words corpus, which is only compiled (and nltk imported) if it is missing.
+    """
+    if custom_dict:
+        return open_wordlist(custom_dict, sort=True, lowercase=True)
+    try:
+        store = WordlistStore(index_file)
+    except (OSError, ValueError, struct.error):
+        store = None
+    if store is not None:
+        if store.flags & OPTION_FLAGS == index_flags(sort=True, lowercase=True):
+            return store
+        store.close()
+    build_nltk_index(index_file)
+    return WordlistStore(index_file)
+
+def open_current_index(index_file, stat, sort, lowercase, strip=False):
+    """
+    Opens an index if it exists and was built with these options from the wordlist as it is now, else returns None.
+    """
+    try:
+        store = WordlistStore(index_file)
+    except (OSError, ValueError, struct.error):
+        return None
+    if (store.flags & OPTION_FLAGS == index_flags(sort, lowercase, strip) and store.source_size == stat.st_size
+            and store.source_mtime == stat.st_mtime_ns):
+        return store
+    store.close()
+    return None
+
+def open_temporary_index(wordlist_file, sort, lowercase, strip=False):
+    """
+    Builds the index in a temporary file that only lives as long as the returned store.
+    """
+    handle, index_file = tempfile.mkstemp(suffix=".wlidx")
+    os.close(handle)
+    try:
+        build_index(wordlist_file, index_file, sort, lowercase, strip=strip)
+        return WordlistStore(index_file)
+    finally:
+        try:
+            os.remove(index_file)  # The mapping stays valid after the file is unlinked
+        except OSError:
+            pass
+
+def open_wordlist(wordlist_file, sort=False, lowercase=False, index_file=None, strip=False):
+    """
+    Opens a wordlist as a WordlistStore, building (or rebuilding, if the wordlist changed) its index first.
+    The index goes next to the wordlist or, if that directory is read-only, to CACHE_DIR; if neither can be
+    written, the index is built in a temporary file for this run only.
+    """
+    if index_file:
+        index_files = [index_file]
+    else:
+        index_files = [default_index_file(wordlist_file, sort, lowercase, strip), cache_index_file(wordlist_file, sort, lowercase, strip)]
+    stat = os.stat(wordlist_file)
+    for candidate in index_files:
+        store = open_current_index(candidate, stat, sort, lowercase, strip)
+        if store is not None:
+            return store
+    for candidate in index_files:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(candidate)), exist_ok=True)
+            build_index(wordlist_file, candidate, sort, lowercase, strip=strip)
+        except OSError:
+            continue
+        return WordlistStore(candidate)
+    return open_temporary_index(wordlist_file, sort, lowercase, strip)
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild memory-mapped wordlist indexes so later runs start instantly.")
+    parser.add_argument("wordlists", nargs="*", help="Wordlist files to index.")
+    parser.add_argument("--sorted", action="store_true", help="Build the sorted index used for dictionary lookups.")
+    parser.add_argument("--stripped", action="store_true", help="Build the stripped index without empty lines (used by Multiple-Words-Joiner.py).")
+    parser.add_argument("--lowercase", action="store_true", help="Lowercase the words (dict-extractor.py and dict_compare.py use --sorted --lowercase).")
+    parser.add_argument("--nltk", action="store_true", help=f"(Re)compile the NLTK words corpus used when no --custom_dict is given into {os.path.basename(NLTK_INDEX_FILE)}.")
+    args = parser.parse_args()
+    if not args.wordlists and not args.nltk:
+        parser.error("give wordlist files to index and/or --nltk")
+
+    if args.nltk:
+        build_nltk_index()
+        with WordlistStore(NLTK_INDEX_FILE) as store:
+            print(f"{NLTK_INDEX_FILE}: {len(store)} words")
+
+    for wordlist_file in args.wordlists:
+        with open_wordlist(wordlist_file, args.sorted, args.lowercase, strip=args.stripped) as store:
+            print(f"{store.index_file}: {len(store)} words")
+
+if __name__ == "__main__":
+    main()